@@ -0,0 +1,294 @@
+"""Benchmark the hostname prefilter in front of the adblock engine
+
+Builds the engine and the prefilter from the filter lists in
+browser/filter_lists (or synthetic lists shaped like EasyPrivacy when they
+haven't been downloaded yet), then times request checks with and without the
+prefilter and makes sure both block the same requests. The engine is timed
+as the browser called it before the prefilter, and with the hosts Qt has
+already parsed, so the prefilter's own share shows. Also builds a compact
+engine from the rules hit in the first half of the requests and counts what
+it misses in the second half, and at which rate:
+
+    python benchmarks/adblock_bench.py --requests 50000 -o results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+import adblock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from browser.filters import (  # noqa: E402
+    HostPrefilter,
+    RuleHits,
+    build_host_prefilter,
+    compact_rules,
+)
+
+LISTS_DIR = Path(__file__).parent.parent / "browser" / "filter_lists"
+TLDS = ["com", "net", "io", "org", "co.uk"]
+RESOURCE_TYPES = [
+    "main_frame",
+    "script",
+    "image",
+    "xhr",
+    "stylesheet",
+    "sub_frame",
+    "ping",
+]
+
+
+def synthetic_rules(rng: random.Random) -> list[str]:
+    """Roughly the mix of EasyPrivacy: mostly ||host^, some paths and options"""
+    rules = ["! Synthetic tracker list"]
+    rules += [f"||trk{i}.{rng.choice(TLDS)}^" for i in range(25_000)]
+    rules += [f"||cdn{i}.com/pixel/$image,third-party" for i in range(3_000)]
+    rules += [f"/analytics{i}.js$script" for i in range(3_000)]
+    rules += [f"||stats{i}.net^$third-party" for i in range(2_000)]
+    rules += [f"@@||ok.trk{i}.com^" for i in range(0, 25_000, 50)]
+    rules += [f"@@/analytics{i}.js$domain=site{i}.org" for i in range(500)]
+    rules += [f"news{i}.com##.ad-banner" for i in range(2_000)]
+    return rules
+
+
+def load_rules(lists_dir: Path, rng: random.Random) -> tuple[str, list[str]]:
+    files = sorted(lists_dir.glob("*.txt")) if lists_dir.exists() else []
+    if not files:
+        return "synthetic", synthetic_rules(rng)
+    rules: list[str] = []
+    for path in files:
+        rules.extend(path.read_text(encoding="utf-8").splitlines())
+    return ", ".join(path.name for path in files), rules
+
+
+def make_requests(
+    prefilter: HostPrefilter, count: int, hit_ratio: float, rng: random.Random
+) -> list[tuple[str, str, str, str, str]]:
+    """(url, host, source url, source host, type) tuples, hit_ratio on trackers"""
+    blocked = sorted(prefilter.blocked)
+    # Like real browsing, most hits go to a few hundred popular trackers
+    popular = rng.sample(blocked, min(500, len(blocked)))
+    requests = []
+    for i in range(count):
+        source_host = f"www.site{rng.randrange(5_000)}.com"
+        request_type = rng.choice(RESOURCE_TYPES)
+        if blocked and rng.random() < hit_ratio:
+            if rng.random() < 0.2:
+                # Path rules, e.g. ||cdn1.com/pixel/$image in the synthetic list
+                host = f"cdn{rng.randrange(100 if rng.random() < 0.9 else 3_000)}.com"
+                url = f"https://{host}/pixel/{i}.gif"
+                request_type = "image"
+            else:
+                host = rng.choice(popular if rng.random() < 0.9 else blocked)
+                if rng.random() < 0.3:
+                    host = f"cdn.{host}"
+                url = f"https://{host}/collect?v=1&id={i}"
+        else:
+            host = f"static{rng.randrange(5_000)}.example.{rng.choice(TLDS)}"
+            url = f"https://{host}/assets/app{i % 100}.js"
+        requests.append(
+            (url, host, f"https://{source_host}/", source_host, request_type)
+        )
+    return requests
+
+
+def compact_report(
+    rules: list[str],
+    requests: list[tuple[str, str, str, str, str]],
+    full_blocked: list[bool],
+) -> dict[str, Any]:
+    """Track hits over the first half of the requests, replay the rest compact
+
+    Both go through the engine alone, as with the prefilter off by default.
+    """
+    start = time.perf_counter()
+    filter_set = adblock.FilterSet(debug=True)
+    filter_set.add_filters(rules)
+    engine = adblock.Engine(filter_set)
+    full_build = time.perf_counter() - start
+    full_size = len(engine.serialize())
+
+    half = len(requests) // 2
+    hits = RuleHits(Path(os.devnull))
+    for url, host, _, source_host, request_type in requests[:half]:
+        result = engine.check_network_urls_with_hostnames(
+            url, host, source_host, request_type, None
+        )
+        if result.matched and result.filter:
+            hits.record(result.filter)
+
+    kept = compact_rules(rules, hits.recent(30))
+    start = time.perf_counter()
+    filter_set = adblock.FilterSet(debug=True)
+    filter_set.add_filters(kept)
+    compact = adblock.Engine(filter_set)
+    compact_build = time.perf_counter() - start
+    compact_size = len(compact.serialize())
+
+    # Requests the full lists block but the compact engine lets through
+    blocked_in_replay = full_blocked[half:]
+    blocked = sum(blocked_in_replay)
+    missed = 0
+    for (url, host, _, source_host, request_type), full in zip(
+        requests[half:], blocked_in_replay
+    ):
+        if not full:
+            continue
+        result = compact.check_network_urls_with_hostnames(
+            url, host, source_host, request_type, None
+        )
+        missed += not result.matched
+
+    return {
+        "rules": len(kept),
+        "full_build_ms": round(full_build * 1000, 1),
+        "compact_build_ms": round(compact_build * 1000, 1),
+        "full_size_mb": round(full_size / 1024**2, 2),
+        "compact_size_mb": round(compact_size / 1024**2, 2),
+        "missed_blocks": missed,
+        "blocked_in_replay": blocked,
+        "miss_rate": round(missed / blocked, 4) if blocked else 0.0,
+    }
+
+
+def per_request_us(seconds: float, count: int) -> float:
+    return round(seconds / count * 1_000_000, 3)
+
+
+def best_time(
+    check: Callable[[tuple[str, str, str, str, str]], Any],
+    requests: list[tuple[str, str, str, str, str]],
+    repeat: int,
+) -> float:
+    """Fastest of repeat passes over the requests, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for request in requests:
+            check(request)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").partition("\n")[0])
+    parser.add_argument("--lists", type=Path, default=LISTS_DIR)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument(
+        "--hit-ratio", type=float, default=0.3, help="share of tracker requests"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timed passes, the fastest counts"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", help="also write the results to a file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    source, rules = load_rules(args.lists, rng)
+
+    start = time.perf_counter()
+    filter_set = adblock.FilterSet()
+    filter_set.add_filters(rules)
+    engine = adblock.Engine(filter_set)
+    engine_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prefilter = build_host_prefilter(rules)
+    prefilter_build = time.perf_counter() - start
+
+    # A separate build, tracemalloc slows down the one it watches
+    tracemalloc.start()
+    retained = build_host_prefilter(rules)
+    prefilter_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+
+    requests = make_requests(prefilter, args.requests, args.hit_ratio, rng)
+
+    def engine_check(request: tuple[str, str, str, str, str]) -> bool:
+        url, _, source_url, _, request_type = request
+        return engine.check_network_urls(url, source_url, request_type).matched
+
+    def hostnames_check(request: tuple[str, str, str, str, str]) -> bool:
+        url, host, _, source_host, request_type = request
+        return engine.check_network_urls_with_hostnames(
+            url, host, source_host, request_type, None
+        ).matched
+
+    def prefilter_check(request: tuple[str, str, str, str, str]) -> bool:
+        # As in the browser, which already has both hosts at hand
+        url, host, _, source_host, request_type = request
+        if request_type != "main_frame" and prefilter.blocking_domain(
+            url, host, source_host
+        ):
+            return True
+        return engine.check_network_urls_with_hostnames(
+            url, host, source_host, request_type, None
+        ).matched
+
+    engine_blocked = [engine_check(request) for request in requests]
+    combined_blocked = [prefilter_check(request) for request in requests]
+    mismatches = sum(a != b for a, b in zip(engine_blocked, combined_blocked))
+    decided = [
+        request[4] != "main_frame"
+        and bool(prefilter.blocking_domain(*request[:2], request[3]))
+        for request in requests
+    ]
+    # Requests the prefilter leaves to the engine, where it only adds its cost
+    misses = [request for request, hit in zip(requests, decided) if not hit]
+
+    engine_seconds = best_time(engine_check, requests, args.repeat)
+    hostnames_seconds = best_time(hostnames_check, requests, args.repeat)
+    combined_seconds = best_time(prefilter_check, requests, args.repeat)
+    miss_count = max(len(misses), 1)
+    miss_engine_seconds = best_time(hostnames_check, misses, args.repeat)
+    miss_combined_seconds = best_time(prefilter_check, misses, args.repeat)
+    report: dict[str, Any] = {
+        "date": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "rules": {"source": source, "count": len(rules)},
+        "prefilter": {
+            "domains": len(prefilter),
+            "exception_hosts": len(prefilter.exception_hosts),
+            "exception_first_parties": len(prefilter.exception_first_parties),
+            "exception_tokens": len(prefilter.exception_tokens),
+            "build_ms": round(prefilter_build * 1000, 1),
+            "memory_mb": round(prefilter_memory / (1024**2), 2),
+        },
+        "engine_build_ms": round(engine_build * 1000, 1),
+        "requests": args.requests,
+        "blocked": sum(engine_blocked),
+        "prefilter_hits": sum(decided),
+        "engine_only_us": per_request_us(engine_seconds, args.requests),
+        "engine_hostnames_us": per_request_us(hostnames_seconds, args.requests),
+        "with_prefilter_us": per_request_us(combined_seconds, args.requests),
+        "speedup": round(engine_seconds / combined_seconds, 2),
+        "speedup_vs_hostnames": round(hostnames_seconds / combined_seconds, 2),
+        "miss_path": {
+            "requests": len(misses),
+            "engine_hostnames_us": per_request_us(miss_engine_seconds, miss_count),
+            "with_prefilter_us": per_request_us(miss_combined_seconds, miss_count),
+        },
+        "mismatches": mismatches,
+        "compact_engine": compact_report(rules, requests, engine_blocked),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Benchmark the history and favicon persistence layer
+
+Generates synthetic histories and measures how long recording a visit and
+updating a favicon take, how big the files get and how much memory is used.
+Runs headless, results are printed (and optionally saved) as JSON so other
+storage engines can be compared against the current JSON files:
+
+    python benchmarks/history_bench.py --sizes 1000 100000 1000000 -o results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from statistics import mean, median
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QUrl  # noqa: E402
+from PyQt6.QtGui import QColor, QGuiApplication, QIcon, QPixmap  # noqa: E402
+
+from browser.history import (  # noqa: E402
+    append_to_favicons,
+    append_to_history,
+    get_favicon_id,
+)
+
+WORDS = ["news", "mail", "docs", "video", "shop", "wiki", "blog", "forum", "search"]
+
+
+class FakePage:
+    """Stands in for WebPage, exposing what the history layer reads"""
+
+    def __init__(self, url: str, title: str, icon: QIcon | None = None) -> None:
+        self._url = QUrl(url)
+        self._title = title
+        self._icon = icon or QIcon()
+
+    def url(self) -> QUrl:
+        return self._url
+
+    def title(self) -> str:
+        return self._title
+
+    def icon(self) -> QIcon:
+        return self._icon
+
+
+def make_icon(seed: int) -> QIcon:
+    pixmap = QPixmap(16, 16)
+    pixmap.fill(QColor.fromHsv(seed % 360, 200, 200))
+    return QIcon(pixmap)
+
+
+def synthetic_url(domain_id: int, page_id: int) -> str:
+    return f"https://www.{WORDS[domain_id % len(WORDS)]}{domain_id}.com/{page_id}"
+
+
+@dataclass
+class Backend:
+    """A storage engine under test, seeded with synthetic data first"""
+
+    name: str
+    seed: Callable[[Path, int, int, random.Random], None]
+    record_visit: Callable[[FakePage, Path], Any]
+    update_favicon: Callable[[FakePage, Path], Any]
+    files: Callable[[Path], list[Path]]
+
+
+def seed_json_files(
+    data_dir: Path, visits: int, domains: int, rng: random.Random
+) -> None:
+    """Write history.json and favicons.json as the browser would have"""
+    urls = max(1, visits // 4)
+    today = date.today()
+    history: dict[str, dict[str, dict]] = {}
+
+    for _ in range(visits):
+        url_id = rng.randrange(urls)
+        domain_id = url_id % domains
+        day = today - timedelta(days=rng.randrange(365))
+        url = synthetic_url(domain_id, url_id)
+        domain = url.split("/")[2].removeprefix("www.")
+        entries = history.setdefault(str(day), {})
+        entry = entries.get(url)
+        if not entry:
+            entry = entries[url] = {
+                "title": f"{WORDS[url_id % len(WORDS)].title()} page {url_id}",
+                "url": url,
+                "canonical_url": url,
+                "favicon_id": get_favicon_id(domain),
+                "visits": [],
+            }
+        timestamp = datetime.combine(day, datetime.min.time()).timestamp()
+        entry["visits"].append(timestamp + rng.randrange(86400))
+
+    with open(data_dir / "history.json", "w") as f:
+        json.dump(
+            {day: list(entries.values()) for day, entries in history.items()},
+            f,
+            indent=2,
+        )
+
+    # Roughly the size of a real 24x24 PNG favicon
+    icon_data = "data:image/png;base64," + "A" * 1200
+    favicons = {}
+    for domain_id in range(min(domains, urls)):
+        domain = synthetic_url(domain_id, 0).split("/")[2].removeprefix("www.")
+        favicons[get_favicon_id(domain)] = {
+            "domain": domain,
+            "icon_data": icon_data,
+            "last_updated": datetime.now().isoformat(),
+            "status": "loaded",
+        }
+    with open(data_dir / "favicons.json", "w") as f:
+        json.dump(favicons, f, indent=2)
+
+
+BACKENDS = {
+    "json": Backend(
+        name="json",
+        seed=seed_json_files,
+        record_visit=lambda page, data_dir: append_to_history(page, data_dir),
+        update_favicon=lambda page, data_dir: append_to_favicons(
+            page, page.icon(), data_dir
+        ),
+        files=lambda data_dir: [
+            data_dir / "history.json",
+            data_dir / "favicons.json",
+        ],
+    ),
+}
+
+
+def summarize(latencies: list[float]) -> dict[str, float | int]:
+    ordered = sorted(latencies)
+    return {
+        "samples": len(ordered),
+        "mean_ms": round(mean(ordered), 3),
+        "p50_ms": round(median(ordered), 3),
+        "p95_ms": round(ordered[max(0, int(len(ordered) * 0.95) - 1)], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def timed_samples(
+    operation: Callable[[int], Any], samples: int, budget: float
+) -> list[float]:
+    """Run the operation up to samples times, within a time budget"""
+    latencies: list[float] = []
+    deadline = time.perf_counter() + budget
+    for i in range(samples):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+        # Always keep a few samples, even for very slow sizes
+        if i >= 2 and time.perf_counter() > deadline:
+            break
+    return latencies
+
+
+def run_size(
+    backend: Backend,
+    visits: int,
+    domains: int,
+    samples: int,
+    budget: float,
+    rng: random.Random,
+) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="veil-history-bench-") as temp_dir:
+        data_dir = Path(temp_dir)
+
+        start = time.perf_counter()
+        backend.seed(data_dir, visits, domains, rng)
+        seed_seconds = time.perf_counter() - start
+        urls = max(1, visits // 4)
+
+        def record_visit(i: int) -> None:
+            # Half revisits of known pages, half new pages
+            url_id = rng.randrange(urls) if i % 2 else urls + i
+            page = FakePage(synthetic_url(url_id % domains, url_id), f"Page {url_id}")
+            backend.record_visit(page, data_dir)
+
+        def update_favicon(i: int) -> None:
+            # New domains, so the favicon is really written
+            domain_id = domains + i
+            page = FakePage(synthetic_url(domain_id, 0), "", make_icon(domain_id))
+            backend.update_favicon(page, data_dir)
+
+        record_latencies = timed_samples(record_visit, samples, budget)
+        favicon_latencies = timed_samples(update_favicon, samples, budget)
+
+        # A separate pass, tracemalloc slows down the operations it watches
+        tracemalloc.start()
+        record_visit(1)
+        update_favicon(samples)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "visits": visits,
+            "domains": domains,
+            "seed_s": round(seed_seconds, 3),
+            "record_visit": summarize(record_latencies),
+            "update_favicon": summarize(favicon_latencies),
+            "file_bytes": {
+                path.name: path.stat().st_size
+                for path in backend.files(data_dir)
+                if path.exists()
+            },
+            "peak_memory_mb": round(peak / (1024**2), 2),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=(__doc__ or "").partition("\n")[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--domains", type=int, default=2_000)
+    parser.add_argument(
+        "--samples", type=int, default=100, help="operations timed per size"
+    )
+    parser.add_argument(
+        "--budget", type=float, default=60, help="seconds of sampling per size"
+    )
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="json")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", help="also write the results to a file")
+    args = parser.parse_args()
+
+    # Needed to turn favicons into PNG data
+    app = QGuiApplication([sys.argv[0]])  # noqa: F841
+
+    rng = random.Random(args.seed)
+    backend = BACKENDS[args.backend]
+    results = []
+    for visits in args.sizes:
+        print(f"Benchmarking {backend.name} with {visits} visits...", file=sys.stderr)
+        results.append(
+            run_size(backend, visits, args.domains, args.samples, args.budget, rng)
+        )
+
+    report = {
+        "backend": backend.name,
+        "date": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
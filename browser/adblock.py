@@ -1,22 +1,107 @@
+from datetime import date
+import json
 from pathlib import Path
+from time import perf_counter
 from urllib.request import urlretrieve
+from PyQt6.QtCore import QCoreApplication, QTimer
 from PyQt6.QtWebEngineCore import (
+    QWebEngineProfile,
     QWebEngineUrlRequestInfo,
     QWebEngineUrlRequestInterceptor,
 )
 import adblock
 
-from browser.utils import setup_logging
+from browser.filters import (
+    HostPrefilter,
+    RuleHits,
+    build_host_prefilter,
+    compact_rules,
+)
+from browser.redirects import RESOURCE_SCHEME, RedirectResources
+from browser.utils import Config, HostTrie, WatchedFiles, setup_logging
 
 ResourceType = QWebEngineUrlRequestInfo.ResourceType
 
+# Map Qt resource types to adblock resource types
+RESOURCE_TYPES = {
+    ResourceType.ResourceTypeUnknown: "other",
+    ResourceType.ResourceTypeMainFrame: "main_frame",
+    ResourceType.ResourceTypeSubFrame: "sub_frame",
+    ResourceType.ResourceTypeStylesheet: "stylesheet",
+    ResourceType.ResourceTypeScript: "script",
+    ResourceType.ResourceTypeImage: "image",
+    ResourceType.ResourceTypeFontResource: "font",
+    ResourceType.ResourceTypeSubResource: "sub_resource",
+    ResourceType.ResourceTypeObject: "object",
+    ResourceType.ResourceTypeMedia: "media",
+    ResourceType.ResourceTypeWorker: "worker",
+    ResourceType.ResourceTypeSharedWorker: "shared_worker",
+    ResourceType.ResourceTypePrefetch: "prefetch",
+    ResourceType.ResourceTypeFavicon: "favicon",
+    ResourceType.ResourceTypeXhr: "xhr",
+    ResourceType.ResourceTypePing: "ping",
+    ResourceType.ResourceTypeServiceWorker: "service_worker",
+    ResourceType.ResourceTypeCspReport: "csp_report",
+    ResourceType.ResourceTypePluginResource: "plugin_resource",
+    ResourceType.ResourceTypeNavigationPreloadMainFrame: "navigation_preload_main_frame",
+    ResourceType.ResourceTypeNavigationPreloadSubFrame: "navigation_preload_sub_frame",
+    ResourceType.ResourceTypeWebSocket: "web_socket",
+    ResourceType.ResourceTypeJson: "json",
+}
+
+# Top-level navigations, never decided by the hostname prefilter
+DOCUMENT_TYPES = {"main_frame", "navigation_preload_main_frame"}
+
+USER_FILTERS_HEADER = """! Veil Browser user filters
+! One adblock rule per line, e.g. ||example.com^ or @@||example.com^
+! Changes apply right away, no restart needed
+"""
+
 
 class AdBlockInterceptor(QWebEngineUrlRequestInterceptor):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.adblock_engine = None
-        self.load_filters()
+        self.prefilter: HostPrefilter | None = None
         self.logger = setup_logging()
+        self.config = Config.load()
+        # No-op stubs for $redirect rules, served over veil-resource:
+        self.redirects = RedirectResources(self)
+
+        # Which list rules match, what a compact engine is built from
+        self.hits: RuleHits | None = None
+        if self.config.adblock_hit_tracking:
+            self.hits = RuleHits.load(
+                Path(__file__).parent.parent / "data/adblock_hits.json"
+            )
+            self._hits_timer = QTimer(self)
+            self._hits_timer.timeout.connect(self.hits.save)
+            self._hits_timer.start(60 * 1000)
+            instance = QCoreApplication.instance()
+            if instance:
+                instance.aboutToQuit.connect(self.hits.save)
+
+        self.load_filters()
+
+        # Sites the user turned blocking off for, matched on the first party
+        self.allowlist_file = (
+            Path(__file__).parent.parent / "data/adblock_allowlist.json"
+        )
+        self.allowlist: set[str] = set()
+        self.allowlist_trie: HostTrie[bool] = HostTrie()
+        self.engine_checks_avoided = 0
+        self.load_allowlist()
+
+        # Small overlay engine, rebuilt on its own whenever the user edits it
+        self.user_engine = None
+        self.user_filters_file = Path(__file__).parent.parent / "data/user_filters.txt"
+        if not self.user_filters_file.exists():
+            self.user_filters_file.parent.mkdir(parents=True, exist_ok=True)
+            self.user_filters_file.write_text(USER_FILTERS_HEADER, encoding="utf-8")
+        self.load_user_filters()
+
+        self._user_filters_watcher = WatchedFiles([self.user_filters_file], self)
+        self._user_filters_watcher.changed.connect(self.load_user_filters)
 
     def load_filters(self):
         """Load adblock filter lists"""
@@ -34,58 +119,229 @@ class AdBlockInterceptor(QWebEngineUrlRequestInterceptor):
         all_rules = []
         for filter_name, filter_url in filter_lists.items():
             filter_file = filter_lists_dir / filter_name
-            try:
-                with open(filter_file, "r", encoding="utf-8") as f:
-                    all_rules.extend(f.readlines())
-            except FileNotFoundError:
+            if not filter_file.exists():
                 urlretrieve(filter_url, filter_file)
+            with open(filter_file, "r", encoding="utf-8") as f:
+                all_rules.extend(f.readlines())
 
-        # Build filter set
-        filter_set = adblock.FilterSet()
-        filter_set.add_filters(all_rules)
+        self.build_engine(all_rules)
 
+        if not self.config.adblock_host_prefilter:
+            return
+        start = perf_counter()
+        self.prefilter = build_host_prefilter(all_rules)
+        self.logger.info(
+            f"Host prefilter built with {len(self.prefilter)} domains"
+            f" in {(perf_counter() - start) * 1000:.1f} ms"
+        )
+
+    def build_engine(self, all_rules: list[str]):
+        """Build the engine from every rule, or only recently matched ones"""
+        hits = self.hits
+        if self.config.adblock_compact_engine and hits is None:
+            self.logger.warning(
+                "[WARN] adblock_compact_engine needs adblock_hit_tracking,"
+                " building the full engine"
+            )
+        compact = (
+            hits is not None
+            and self.config.adblock_compact_engine
+            and not hits.full_build_due(self.config.adblock_full_rebuild_days)
+        )
+        if compact and hits:
+            rules = compact_rules(
+                all_rules, hits.recent(self.config.adblock_compact_days)
+            )
+        else:
+            rules = all_rules
+
+        start = perf_counter()
+        # Debug filter sets report the text of the rule that matched
+        filter_set = adblock.FilterSet(debug=hits is not None)
+        filter_set.add_filters(rules)
         self.adblock_engine = adblock.Engine(filter_set)
+        self.redirects.add_to(self.adblock_engine)
+        build_ms = (perf_counter() - start) * 1000
+
+        if hits is None:
+            return
+        # The serialized engine stands in for its memory, which is Rust side
+        size = len(self.adblock_engine.serialize())
+        if not compact:
+            hits.full_build = {
+                "date": date.today().isoformat(),
+                "rules": len(rules),
+                "build_ms": round(build_ms, 1),
+                "size_bytes": size,
+            }
+            hits.dirty = True
+            hits.save()
+            self.logger.info(
+                f"Full adblock engine: {len(rules)} rules in {build_ms:.0f} ms,"
+                f" {size / 1024**2:.1f} MB"
+            )
+            return
+
+        full = hits.full_build
+        self.logger.info(
+            f"Compact adblock engine: {len(rules)} of {full['rules']} rules"
+            f" in {build_ms:.0f} ms, {size / 1024**2:.1f} MB"
+            f" (saved {full['build_ms'] - build_ms:.0f} ms and"
+            f" {(full['size_bytes'] - size) / 1024**2:.1f} MB, full rebuild"
+            f" every {self.config.adblock_full_rebuild_days} days)"
+        )
+
+    def load_allowlist(self):
+        """Load data/adblock_allowlist.json, a list of domains"""
+        if self.allowlist_file.exists():
+            try:
+                with open(self.allowlist_file, "r") as f:
+                    self.allowlist = set(json.load(f))
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"[WARN] Could not read adblock allowlist: {e}")
+        self.allowlist_trie = HostTrie.from_domains(self.allowlist)
+
+    def is_allowlisted(self, host: str) -> bool:
+        return host in self.allowlist_trie
+
+    def toggle_site(self, host: str) -> bool:
+        """Turn blocking off or back on for a site, returns if it's now allowed"""
+        domain = host.lower().removeprefix("www.")
+        if self.is_allowlisted(domain):
+            # Also drop a parent domain entry that covers this host
+            self.allowlist = {
+                allowed
+                for allowed in self.allowlist
+                if domain != allowed and not domain.endswith("." + allowed)
+            }
+        else:
+            self.allowlist.add(domain)
+
+        self.allowlist_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.allowlist_file, "w") as f:
+            json.dump(sorted(self.allowlist), f, indent=2)
+        # Swapped in one go, the IO thread never sees a half-built trie
+        self.allowlist_trie = HostTrie.from_domains(self.allowlist)
+
+        allowed = self.is_allowlisted(domain)
+        self.logger.info(
+            f"Adblock {'off' if allowed else 'on'} for {domain}"
+            f" ({self.engine_checks_avoided} engine checks skipped so far)"
+        )
+        return allowed
+
+    def load_user_filters(self):
+        """(Re)build the overlay engine from data/user_filters.txt"""
+        start = perf_counter()
+        try:
+            with open(self.user_filters_file, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        except (OSError, UnicodeDecodeError) as e:
+            # Keep the rules we have, the file may be fixed with the next save
+            self.logger.warning(f"[WARN] Could not read user filters: {e}")
+            return
+
+        rules = [
+            line
+            for line in lines
+            if line.strip() and not line.lstrip().startswith(("!", "["))
+        ]
+        if not rules:
+            # Nothing to check, requests skip the overlay altogether
+            self.user_engine = None
+        else:
+            filter_set = adblock.FilterSet()
+            filter_set.add_filters(rules)
+            user_engine = adblock.Engine(filter_set)
+            self.redirects.add_to(user_engine)
+            self.user_engine = user_engine
+
+        elapsed = (perf_counter() - start) * 1000
+        self.logger.info(
+            f"User filters loaded ({len(rules)} rules) in {elapsed:.1f} ms"
+        )
+
+    def install(self, profile: QWebEngineProfile, intercept: bool = True):
+        """Serve the redirect stubs and intercept the profile's requests,
+        unless its pages get an interceptor of their own"""
+        if intercept:
+            profile.setUrlRequestInterceptor(self)
+        profile.installUrlSchemeHandler(RESOURCE_SCHEME, self.redirects)
 
     def interceptRequest(self, info):
         """Intercept and block requests matching adblock rules"""
-        url = info.requestUrl().toString()
-        source_url = info.firstPartyUrl().toString()
-
-        # Map Qt resource types to adblock resource types
-        resource_type_map = {
-            ResourceType.ResourceTypeUnknown: "other",
-            ResourceType.ResourceTypeMainFrame: "main_frame",
-            ResourceType.ResourceTypeSubFrame: "sub_frame",
-            ResourceType.ResourceTypeStylesheet: "stylesheet",
-            ResourceType.ResourceTypeScript: "script",
-            ResourceType.ResourceTypeImage: "image",
-            ResourceType.ResourceTypeFontResource: "font",
-            ResourceType.ResourceTypeSubResource: "sub_resource",
-            ResourceType.ResourceTypeObject: "object",
-            ResourceType.ResourceTypeMedia: "media",
-            ResourceType.ResourceTypeWorker: "worker",
-            ResourceType.ResourceTypeSharedWorker: "shared_worker",
-            ResourceType.ResourceTypePrefetch: "prefetch",
-            ResourceType.ResourceTypeFavicon: "favicon",
-            ResourceType.ResourceTypeXhr: "xhr",
-            ResourceType.ResourceTypePing: "ping",
-            ResourceType.ResourceTypeServiceWorker: "service_worker",
-            ResourceType.ResourceTypeCspReport: "csp_report",
-            ResourceType.ResourceTypePluginResource: "plugin_resource",
-            ResourceType.ResourceTypeNavigationPreloadMainFrame: "navigation_preload_main_frame",
-            ResourceType.ResourceTypeNavigationPreloadSubFrame: "navigation_preload_sub_frame",
-            ResourceType.ResourceTypeWebSocket: "web_socket",
-            ResourceType.ResourceTypeJson: "json",
-        }
+        self.check(info)
+
+    def check(self, info) -> bool:
+        """Block or redirect the request if a rule says so, True if it did"""
+        first_party = info.firstPartyUrl()
+        source_host = first_party.host()
+
+        # Allowlisted sites skip the engines entirely
+        if self.allowlist_trie and self.is_allowlisted(source_host):
+            self.engine_checks_avoided += 1
+            return False
+
+        request_url = info.requestUrl()
+        url = request_url.toString()
+        host = request_url.host()
 
-        resource_type = resource_type_map.get(info.resourceType(), "other")
+        resource_type = RESOURCE_TYPES.get(info.resourceType(), "other")
+
+        # User rules come first, their exceptions override the lists
+        if self.user_engine:
+            # Exceptions are checked even when no user block rule matches
+            result = self.user_engine.check_network_urls_with_hostnames_subset(
+                url,
+                host,
+                source_host,
+                resource_type,
+                None,
+                False,
+                True,
+            )
+            if result.exception is not None:
+                return False
+            if result.matched:
+                self._block(info, url, result.redirect, "Blocked (user filter)")
+                return True
+
+        # Plain ||host^ rules are decided with a few set lookups, except for
+        # top-level navigations, the engine knows how rules treat documents.
+        # Opt-in, it only pays off when most requests go to trackers
+        domain = None
+        if self.prefilter and resource_type not in DOCUMENT_TYPES:
+            domain = self.prefilter.blocking_domain(url, host, source_host)
+        if domain:
+            if self.hits:
+                self.hits.record(f"||{domain}^")
+            self._block(info, url)
+            return True
 
         # Check if URL should be blocked
         if self.adblock_engine:
-            blocked = self.adblock_engine.check_network_urls(
-                url=url, source_url=source_url, request_type=resource_type
+            # Qt has parsed both hosts already, the engine needn't again
+            blocked = self.adblock_engine.check_network_urls_with_hostnames(
+                url, host, source_host, resource_type, None
             )
 
-            if blocked:
-                info.block(True)
-                self.logger.info(f"Blocked: {url}")
+            if blocked.matched:
+                if self.hits and blocked.filter:
+                    self.hits.record(blocked.filter)
+                self._block(info, url, blocked.redirect)
+                return True
+        return False
+
+    def _block(self, info, url, redirect=None, label="Blocked"):
+        """Block a request, or answer it with a stub when the rule redirects"""
+        stub = self.redirects.url_for(redirect)
+        if stub:
+            # Pages get a working no-op instead of waiting on or retrying it
+            info.redirect(stub)
+            self.redirects.redirected += 1
+            self.logger.info(f"{label}, redirected to {stub.toString()}: {url}")
+        else:
+            info.block(True)
+            self.logger.info(f"{label}: {url}")
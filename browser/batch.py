@@ -0,0 +1,245 @@
+import json
+import math
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+from PyQt6.QtCore import QObject, QTimer, QUrl, pyqtSignal
+from PyQt6.QtWebEngineCore import QWebEngineProfile, QWebEngineUrlRequestInterceptor
+
+from browser.adblock import AdBlockInterceptor
+from browser.memory import renderer_memory_mb
+from browser.qt import WebView
+from browser.tabs import Tabs
+from browser.utils import setup_logging
+
+
+@dataclass
+class PageResult:
+    url: str
+    ok: bool
+    load_ms: float
+    blocked_requests: int
+    renderer_mb: float | None
+
+
+def read_url_list(path: str | Path) -> list[str]:
+    """Read one URL per line, skipping blank lines and # comments"""
+    urls: list[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                urls.append(line)
+    return urls
+
+
+class PageBlockCounter(QWebEngineUrlRequestInterceptor):
+    """Runs one page's requests through the ad blocker, counting blocks"""
+
+    def __init__(self, blocker: AdBlockInterceptor, parent: QObject | None = None):
+        super().__init__(parent)
+        self.blocker = blocker
+        self.blocked = 0
+
+    def interceptRequest(self, info) -> None:
+        if self.blocker.check(info):
+            self.blocked += 1
+
+
+class BatchRunner(QObject):
+    """Loads a list of URLs through N tabs at a time and measures each load"""
+
+    # Signal emitted once every URL has been loaded or timed out
+    finished = pyqtSignal()
+
+    def __init__(
+        self,
+        urls: list[str],
+        parallel: int = 4,
+        timeout: float = 30,
+        parent: QObject | None = None,
+    ) -> None:
+        super().__init__(parent)
+        self.logger = setup_logging()
+        self.urls = urls
+        self.parallel = max(1, min(parallel, len(urls)))
+        self.timeout_ms = int(timeout * 1000)
+        self.results: list[PageResult] = []
+        self.elapsed = 0.0
+
+        # Same profile and rules as an interactive window, but checked per
+        # page, the first-party URL can't tell pages apart after redirects
+        self.interceptor = AdBlockInterceptor()
+        profile = QWebEngineProfile.defaultProfile()
+        if profile:
+            self.interceptor.install(profile, intercept=False)
+        self._counters: dict[WebView, PageBlockCounter] = {}
+
+        self.tabs: Tabs | None = None
+        self._next = 0
+        self._started = 0.0
+        self._loads: dict[WebView, tuple[str, float]] = {}
+        self._timeouts: dict[WebView, QTimer] = {}
+        # Views whose timed out load was stopped, until it reports back, with
+        # a number telling the fallback timers of successive stops apart
+        self._stopping: dict[WebView, int] = {}
+        self._stops = 0
+
+    def start(self) -> None:
+        self._started = perf_counter()
+        for _ in range(self.parallel):
+            self._load_next(None)
+
+    def _load_next(self, web_view: WebView | None) -> None:
+        if self._next >= len(self.urls):
+            if not self._loads and not self._stopping:
+                self._finish()
+            return
+
+        url = self.urls[self._next]
+        self._next += 1
+        started = perf_counter()
+
+        if web_view:
+            # Late requests of the previous URL don't count against this one
+            self._counters[web_view].blocked = 0
+            web_view.setUrl(QUrl(url))
+        elif not self.tabs:
+            # Tabs always opens with a tab, so it gets the first URL. Batch
+            # pages stay out of the user's history and favicons
+            self.tabs = Tabs(initial_url=url, record_history=False)
+            self.tabs.resize(1280, 800)
+            self.tabs.show()
+            web_view = self.tabs.get_current_web_view()
+        else:
+            web_view = self.tabs.create_new_tab(url)
+
+        if not web_view:
+            self.logger.error(f"[ERR] Batch could not open a tab for {url}")
+            return
+
+        if web_view not in self._timeouts:
+            view = web_view
+            # Installed before the event loop runs, so no request is missed
+            counter = self._counters[view] = PageBlockCounter(self.interceptor, view)
+            page = view.page()
+            if page:
+                page.setUrlRequestInterceptor(counter)
+            view.loadFinished.connect(lambda ok: self._on_load_finished(view, ok))
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(lambda: self._on_timeout(view))
+            self._timeouts[view] = timer
+
+        self._timeouts[web_view].start(self.timeout_ms)
+        self._loads[web_view] = (url, started)
+
+    def _on_load_finished(self, web_view: WebView, ok: bool) -> None:
+        if web_view in self._stopping:
+            # The stopped load, not the next URL, which only starts now
+            self._on_stopped(web_view, self._stopping[web_view])
+            return
+        if web_view not in self._loads:
+            return
+        url, started = self._loads.pop(web_view)
+        self._timeouts[web_view].stop()
+        self._record(web_view, url, started, ok)
+        self._load_next(web_view)
+
+    def _record(self, web_view: WebView, url: str, started: float, ok: bool) -> None:
+        result = PageResult(
+            url=url,
+            ok=ok,
+            load_ms=(perf_counter() - started) * 1000,
+            blocked_requests=self._counters[web_view].blocked,
+            renderer_mb=renderer_memory_mb(web_view),
+        )
+        self.results.append(result)
+        self.logger.info(
+            f"Batch: {'OK' if ok else 'FAILED'} {url} in {result.load_ms:.0f} ms"
+        )
+
+    def _on_timeout(self, web_view: WebView) -> None:
+        if web_view not in self._loads:
+            return
+        url, started = self._loads.pop(web_view)
+        self._record(web_view, url, started, False)
+
+        # Stopping makes the view emit loadFinished(False) later on, the next
+        # URL waits for it so it isn't counted against that load
+        self._stops += 1
+        stop = self._stopping[web_view] = self._stops
+        web_view.stop()
+        # In case no loadFinished comes, e.g. the load had already ended
+        QTimer.singleShot(1000, lambda: self._on_stopped(web_view, stop))
+
+    def _on_stopped(self, web_view: WebView, stop: int) -> None:
+        if self._stopping.get(web_view) != stop:
+            return
+        del self._stopping[web_view]
+        self._load_next(web_view)
+
+    def _finish(self) -> None:
+        self.elapsed = perf_counter() - self._started
+        self.finished.emit()
+
+    def summary(self) -> dict:
+        load_times = sorted(result.load_ms for result in self.results)
+        return {
+            "pages": len(self.results),
+            "succeeded": sum(result.ok for result in self.results),
+            "parallel": self.parallel,
+            "elapsed_s": round(self.elapsed, 3),
+            "pages_per_second": (
+                round(len(self.results) / self.elapsed, 2) if self.elapsed else 0.0
+            ),
+            "median_load_ms": round(median(load_times), 1) if load_times else 0.0,
+            "p95_load_ms": (
+                round(load_times[math.ceil(len(load_times) * 0.95) - 1], 1)
+                if load_times
+                else 0.0
+            ),
+            "blocked_requests": sum(r.blocked_requests for r in self.results),
+            "redirected_to_stubs": self.interceptor.redirects.redirected,
+        }
+
+    def format(self) -> str:
+        lines = [f"{'load':>9} {'blocked':>7} {'renderer':>9}  url"]
+        for result in self.results:
+            renderer = (
+                f"{result.renderer_mb:.0f}MB" if result.renderer_mb is not None else "?"
+            )
+            status = f"{result.load_ms:.0f}ms" if result.ok else "FAILED"
+            lines.append(
+                f"{status:>9} {result.blocked_requests:>7} {renderer:>9}  {result.url}"
+            )
+
+        summary = self.summary()
+        lines.append(
+            f"{summary['succeeded']}/{summary['pages']} pages in"
+            f" {summary['elapsed_s']:.2f}s ({summary['pages_per_second']:.2f} pages/s,"
+            f" median {summary['median_load_ms']:.0f}ms,"
+            f" p95 {summary['p95_load_ms']:.0f}ms)"
+        )
+        return "\n".join(lines)
+
+    def write(self) -> Path:
+        """Write the results to data/logs/batch.json"""
+        root_dir = Path(__file__).parent.parent
+        log_dir = root_dir / "data" / "logs"
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+        batch_file = log_dir / "batch.json"
+        with open(batch_file, "w") as f:
+            json.dump(
+                {
+                    "summary": self.summary(),
+                    "pages": [asdict(result) for result in self.results],
+                },
+                f,
+                indent=2,
+            )
+
+        return batch_file
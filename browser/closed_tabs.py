@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from typing import Any
+
+import psutil
+from PyQt6.QtCore import QByteArray, QDataStream, QIODevice, QUrl
+from PyQt6.QtGui import QIcon
+from PyQt6.QtWebEngineCore import QWebEnginePage
+
+from browser.qt import WebPage, WebView
+from browser.utils import Config, setup_logging
+
+
+@dataclass
+class ClosedTab:
+    """A closed tab, kept alive while frozen, else as its serialized history"""
+
+    url: QUrl
+    title: str
+    icon: QIcon
+    index: int
+    view: WebView | None = None
+    history: QByteArray | None = None
+    # Whether it was muted before being frozen
+    muted: bool = False
+
+
+def serialize_history(page: QWebEnginePage) -> QByteArray:
+    data = QByteArray()
+    history = page.history()
+    if history:
+        # PyQt6 wraps the history's stream operators, its stubs lack them
+        stream: Any = QDataStream(data, QIODevice.OpenModeFlag.WriteOnly)
+        stream << history
+    return data
+
+
+def restore_history(page: QWebEnginePage, data: QByteArray) -> bool:
+    """Restore back/forward history, which also loads its current entry"""
+    history = page.history()
+    if not history or data.isEmpty():
+        return False
+    stream: Any = QDataStream(data, QIODevice.OpenModeFlag.ReadOnly)
+    stream >> history
+    return True
+
+
+class ClosedTabs:
+    """Most recently closed tabs, the newest few frozen for an instant reopen"""
+
+    def __init__(self) -> None:
+        self.config = Config.load()
+        self.logger = setup_logging()
+        self.stack: list[ClosedTab] = []
+
+    def __len__(self) -> int:
+        return len(self.stack)
+
+    def push(self, closed: ClosedTab, open_views: list[WebView]) -> None:
+        if closed.view:
+            page = closed.view.page()
+            if page:
+                # Frozen pages run no scripts or timers, muted in case of media
+                closed.view.hide()
+                closed.muted = page.isAudioMuted()
+                page.setAudioMuted(True)
+                page.setLifecycleState(WebPage.LifecycleState.Frozen)
+        self.stack.append(closed)
+
+        # Count first, oldest dropped entirely
+        while len(self.stack) > max(self.config.closed_tabs_max, 0):
+            self._release(self.stack.pop(0))
+        frozen = self.frozen()
+        for old in frozen[: max(len(frozen) - self.config.closed_tabs_frozen, 0)]:
+            self._release(old, keep_history=True)
+
+        # Then memory, freezing another tab may not be worth its renderer
+        budget = self.config.closed_tabs_memory_mb
+        for old in self.frozen():
+            used = self.frozen_memory_mb(open_views)
+            if used <= budget:
+                break
+            self.logger.info(
+                f"Closed tabs: frozen pages use {used:.0f} MB of {budget} MB,"
+                f" keeping only the history of {old.url.toString()}"
+            )
+            self._release(old, keep_history=True)
+
+    def pop(self) -> ClosedTab | None:
+        if not self.stack:
+            return None
+        closed = self.stack.pop()
+        if closed.view:
+            page = closed.view.page()
+            if page:
+                page.setLifecycleState(WebPage.LifecycleState.Active)
+                page.setAudioMuted(closed.muted)
+            closed.view.show()
+        return closed
+
+    def frozen(self) -> list[ClosedTab]:
+        """Closed tabs still holding a page, oldest first"""
+        return [closed for closed in self.stack if closed.view]
+
+    def frozen_memory_mb(self, open_views: list[WebView]) -> float:
+        """Resident memory of renderers only frozen pages still use"""
+
+        def pids(views: list[WebView]) -> set[int]:
+            pages = [view.page() for view in views]
+            return {page.renderProcessPid() for page in pages if page}
+
+        frozen_views = [closed.view for closed in self.frozen() if closed.view]
+        total = 0
+        for pid in pids(frozen_views) - pids(open_views) - {0}:
+            try:
+                total += psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024**2)
+
+    def release_frozen(self) -> None:
+        """Keep only the history of every closed tab, freeing their pages"""
+        for closed in self.frozen():
+            self._release(closed, keep_history=True)
+
+    def _release(self, closed: ClosedTab, keep_history: bool = False) -> None:
+        view, closed.view = closed.view, None
+        if not view:
+            return
+        page = view.page()
+        if page:
+            if keep_history:
+                closed.history = serialize_history(page)
+            page.deleteLater()
+        view.deleteLater()
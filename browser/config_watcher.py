@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from browser.utils import Config, Keybindings, WatchedFiles, setup_logging
+
+
+class ConfigWatcher(QObject):
+    """Re-reads config.json and keybinds.json whenever they are saved"""
+
+    # Changed setting -> (old value, new value)
+    config_changed = pyqtSignal(dict)
+    # Names of the rebound keybindings
+    keybindings_changed = pyqtSignal(list)
+
+    def __init__(self, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.logger = setup_logging()
+        data_dir = Path(__file__).parent.parent / "data"
+        self._files = WatchedFiles(
+            [data_dir / "config.json", data_dir / "keybinds.json"], self
+        )
+        self._files.changed.connect(self.reload)
+
+    def reload(self) -> None:
+        """Apply the settings and keybindings that differ from the loaded ones"""
+        try:
+            changes = Config.reload()
+        except (OSError, ValueError, TypeError) as e:
+            # Half-written or invalid, keep what we have until the next save
+            self.logger.warning(f"[WARN] Could not reload config: {e}")
+            changes = {}
+        if changes:
+            self.logger.info(f"Config changed: {', '.join(changes)}")
+            self.config_changed.emit(changes)
+
+        try:
+            rebound = Keybindings.reload()
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning(f"[WARN] Could not reload keybindings: {e}")
+            rebound = []
+        if rebound:
+            self.logger.info(f"Keybindings rebound: {', '.join(rebound)}")
+            self.keybindings_changed.emit(rebound)
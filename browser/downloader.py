@@ -0,0 +1,491 @@
+import http.client
+import json
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Literal
+from urllib.parse import urljoin, urlsplit
+
+# Kept free of Qt so it can run (and be tested) without a browser
+
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "Mozilla/5.0 (Veil Browser)"
+
+DownloadStatus = Literal["queued", "downloading", "paused", "finished", "failed"]
+
+
+class RateLimiter:
+    """Token bucket shared by every connection of every download"""
+
+    def __init__(self, bytes_per_second: int = 0) -> None:
+        self.rate = bytes_per_second
+        self._tokens = float(bytes_per_second)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, bytes_per_second: int) -> None:
+        with self._lock:
+            self.rate = bytes_per_second
+            self._tokens = min(self._tokens, float(bytes_per_second))
+
+    def consume(self, amount: int) -> None:
+        """Block until amount bytes may be transferred, 0 means unlimited"""
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.rate), self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                # Let a chunk bigger than the bucket through once it is full
+                if self._tokens >= min(amount, self.rate):
+                    self._tokens -= amount
+                    return
+                wait = (min(amount, self.rate) - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, reused across segments and downloads"""
+
+    def __init__(self, timeout: float = 30) -> None:
+        self.timeout = timeout
+        self._idle: dict[tuple[str, str, int], queue.SimpleQueue] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url: str) -> tuple[str, str, int]:
+        parts = urlsplit(url)
+        default_port = 443 if parts.scheme == "https" else 80
+        return parts.scheme, parts.hostname or "", parts.port or default_port
+
+    def get(self, url: str) -> http.client.HTTPConnection:
+        key = self._key(url)
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.SimpleQueue())
+        try:
+            return idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def put(self, url: str, connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._idle.setdefault(self._key(url), queue.SimpleQueue()).put(connection)
+
+    def request(
+        self, url: str, method: str = "GET", headers: dict[str, str] | None = None
+    ) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """Send a request, following redirects, on a pooled connection"""
+        for _ in range(10):
+            connection = self.get(url)
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            try:
+                connection.request(
+                    method, path, headers={"User-Agent": USER_AGENT, **(headers or {})}
+                )
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                # Idle keep-alive connections may have been closed by the server
+                connection.close()
+                connection = self.get(url)
+                connection.request(
+                    method, path, headers={"User-Agent": USER_AGENT, **(headers or {})}
+                )
+                response = connection.getresponse()
+
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                self.put(url, connection)
+                url = urljoin(url, location)
+                continue
+            return connection, response
+
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            while True:
+                try:
+                    connections.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+class RemoteChanged(http.client.HTTPException):
+    """The file on the server is not the one the saved progress belongs to"""
+
+
+def response_validator(response: http.client.HTTPResponse) -> str | None:
+    """Strong ETag or else Last-Modified, usable in an If-Range header"""
+    etag = response.getheader("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.getheader("Last-Modified")
+
+
+def probe(
+    url: str, pool: ConnectionPool, headers: dict[str, str] | None = None
+) -> tuple[int | None, bool, str | None]:
+    """Find the size of a resource, whether the server supports ranges and
+    the validator identifying this version of it"""
+    connection, response = pool.request(
+        url, headers={**(headers or {}), "Range": "bytes=0-0"}
+    )
+    validator = response_validator(response)
+    if response.status == 206:
+        # Just the one byte asked for, the connection can be reused
+        response.read()
+        pool.put(url, connection)
+        content_range = response.getheader("Content-Range", "")
+        total = content_range.rpartition("/")[2]
+        if total.isdigit():
+            return int(total), True, validator
+        return None, False, validator
+
+    # Anything else may be the whole file, don't read it
+    connection.close()
+    if response.status == 200:
+        length = response.getheader("Content-Length")
+        size = int(length) if length and length.isdigit() else None
+        return size, False, validator
+
+    raise http.client.HTTPException(f"HTTP {response.status} for {url}")
+
+
+def range_start(content_range: str | None) -> int | None:
+    """First byte of a Content-Range such as "bytes 100-199/1000" """
+    unit, _, byte_range = (content_range or "").partition(" ")
+    start = byte_range.partition("-")[0]
+    if unit != "bytes" or not start.isdigit():
+        return None
+    return int(start)
+
+
+@dataclass
+class Segment:
+    start: int
+    end: int  # Inclusive, -1 when the size is unknown
+    done: int = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.end >= 0 and self.start + self.done > self.end
+
+
+@dataclass
+class DownloadState:
+    url: str
+    path: str
+    size: int | None = None
+    ranges: bool = False
+    segments: list[Segment] = field(default_factory=list)
+    status: DownloadStatus = "queued"
+    error: str | None = None
+    # Page the download was started from, some servers check it
+    referer: str | None = None
+    # ETag or Last-Modified of the file the segments were downloaded from
+    validator: str | None = None
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Referer": self.referer} if self.referer else {}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DownloadState":
+        segments = [Segment(**segment) for segment in data.pop("segments", [])]
+        return cls(**data, segments=segments)
+
+
+class SegmentedDownload:
+    """Download a file over several Range requests in parallel"""
+
+    def __init__(
+        self,
+        state: DownloadState,
+        state_file: Path,
+        pool: ConnectionPool,
+        limiter: RateLimiter,
+        connections: int = 4,
+        min_segment_size: int = 1024 * 1024,
+        on_ranges_unsupported: Callable[["SegmentedDownload"], None] | None = None,
+    ) -> None:
+        self.state = state
+        self.state_file = state_file
+        self.pool = pool
+        self.limiter = limiter
+        self.connections = connections
+        self.min_segment_size = min_segment_size
+        # Called from the download thread when there is nothing to segment,
+        # instead of fetching the file over a single connection
+        self.on_ranges_unsupported = on_ranges_unsupported
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._cancelled = False
+        self._thread: threading.Thread | None = None
+        self._errors: list[Exception] = []
+
+    @classmethod
+    def load(
+        cls, state_file: Path, pool: ConnectionPool, limiter: RateLimiter, **kwargs
+    ) -> "SegmentedDownload":
+        """Recreate a download from its state file, paused"""
+        with open(state_file, "r") as f:
+            state = DownloadState.from_dict(json.load(f))
+        if state.status in ("queued", "downloading"):
+            state.status = "paused"
+        return cls(state, state_file, pool, limiter, **kwargs)
+
+    @property
+    def part_path(self) -> Path:
+        return Path(self.state.path + ".part")
+
+    @property
+    def received(self) -> int:
+        return sum(segment.done for segment in self.state.segments)
+
+    @property
+    def is_active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_active or self.state.status == "finished":
+            return
+        self._stop.clear()
+        self.state.status = "downloading"
+        self.state.error = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"download {Path(self.state.path).name}", daemon=True
+        )
+        self._thread.start()
+
+    def pause(self) -> None:
+        """Stop after the current chunks, keeping the progress made so far"""
+        if self.state.status != "downloading":
+            return
+        # The download thread saves its progress once the chunks are written
+        self._stop.set()
+        self.state.status = "paused"
+        self.save_state()
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        self._stop.set()
+        self._discard_files()
+
+    def wait(self, timeout: float | None = None) -> None:
+        """Wait for the download thread to stop, e.g. before exiting"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _discard_files(self) -> None:
+        with self._save_lock:
+            self.part_path.unlink(missing_ok=True)
+            self.state_file.unlink(missing_ok=True)
+
+    def save_state(self) -> None:
+        with self._lock:
+            data = asdict(self.state)
+        with self._save_lock:
+            if self._cancelled:
+                return
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.state_file.with_suffix(".tmp")
+            with open(temp_file, "w") as f:
+                json.dump(data, f, indent=2)
+            temp_file.replace(self.state_file)
+
+    def _plan_segments(self) -> None:
+        state = self.state
+        if state.segments and state.ranges:
+            return
+
+        if not state.ranges or not state.size:
+            # Without ranges there is nothing to resume, start over
+            end = state.size - 1 if state.size else -1
+            state.segments = [Segment(0, end)]
+            return
+
+        count = max(1, min(self.connections, state.size // self.min_segment_size))
+        step = state.size // count
+        state.segments = [
+            Segment(i * step, state.size - 1 if i == count - 1 else (i + 1) * step - 1)
+            for i in range(count)
+        ]
+
+    def _check_remote(self) -> None:
+        """Probe the file, raising RemoteChanged if the progress is outdated"""
+        state = self.state
+        remote = probe(state.url, self.pool, state.headers)
+        if self.received and remote != (state.size, state.ranges, state.validator):
+            raise RemoteChanged(f"{state.url} changed since it was paused")
+        state.size, state.ranges, state.validator = remote
+
+    def _restart(self) -> None:
+        """Throw away the progress made on an older version of the file"""
+        with self._lock:
+            self.state.size = None
+            self.state.segments = []
+            self.state.validator = None
+        self.part_path.unlink(missing_ok=True)
+        self._errors = []
+
+    def _run(self) -> None:
+        state = self.state
+        try:
+            try:
+                transferred = self._transfer()
+            except RemoteChanged:
+                self._restart()
+                if self._cancelled or state.status != "downloading":
+                    self.save_state()
+                    return
+                self._stop.clear()
+                transferred = self._transfer()
+
+            if not transferred:
+                return
+            if self._stop.is_set():
+                self.save_state()
+                return
+
+            self.part_path.replace(state.path)
+            state.status = "finished"
+            self.state_file.unlink(missing_ok=True)
+        except Exception as e:
+            self._stop.set()
+            state.status = "failed"
+            state.error = str(e)
+            self.save_state()
+        finally:
+            if self._cancelled:
+                # Cancelled while running, the part file may have been recreated
+                self._discard_files()
+
+    def _transfer(self) -> bool:
+        """Fetch the missing segments, False if the download was handed back"""
+        state = self.state
+        # Progress is only as good as the partial file it was written to
+        if not self.part_path.exists():
+            for segment in state.segments:
+                segment.done = 0
+
+        self._check_remote()
+        if not state.ranges and self.on_ranges_unsupported:
+            state.status = "failed"
+            state.error = "no range support"
+            self._cancelled = True
+            self._discard_files()
+            self.on_ranges_unsupported(self)
+            return False
+        self._plan_segments()
+
+        # Preallocate, so every segment can write at its own offset
+        mode = "r+b" if self.part_path.exists() and state.ranges else "wb"
+        with open(self.part_path, mode) as f:
+            if state.size:
+                f.truncate(state.size)
+        self.save_state()
+
+        self._errors = []
+        workers = [
+            threading.Thread(target=self._fetch, args=(segment,), daemon=True)
+            for segment in state.segments
+            if not segment.finished
+        ]
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=1)
+            self.save_state()
+
+        if self._errors:
+            raise self._errors[0]
+        return True
+
+    def _fetch(self, segment: Segment) -> None:
+        url = self.state.url
+        headers = self.state.headers
+        offset = segment.start + segment.done
+        if self.state.ranges:
+            headers["Range"] = f"bytes={offset}-{segment.end}"
+            if self.state.validator:
+                # Only the range of this same file, else the whole new one
+                headers["If-Range"] = self.state.validator
+
+        try:
+            connection, response = self.pool.request(url, headers=headers)
+            if self.state.ranges:
+                validator = response_validator(response)
+                if (response.status == 200 and "If-Range" in headers) or (
+                    response.status == 206
+                    and validator
+                    and validator != self.state.validator
+                ):
+                    connection.close()
+                    raise RemoteChanged(f"{url} changed during the download")
+                # A server ignoring the range sends the whole file from byte 0,
+                # written at this offset it would corrupt the download
+                if response.status != 206:
+                    connection.close()
+                    raise http.client.HTTPException(
+                        f"HTTP {response.status} instead of 206 for {url}"
+                    )
+                content_range = response.getheader("Content-Range")
+                if range_start(content_range) != offset:
+                    connection.close()
+                    raise http.client.HTTPException(
+                        f"Content-Range {content_range} doesn't start at {offset}"
+                    )
+            elif response.status != 200:
+                connection.close()
+                raise http.client.HTTPException(f"HTTP {response.status} for {url}")
+
+            with open(self.part_path, "r+b") as f:
+                f.seek(segment.start + segment.done)
+                while not self._stop.is_set():
+                    if segment.end >= 0:
+                        remaining = segment.end + 1 - segment.start - segment.done
+                        if remaining <= 0:
+                            break
+                        chunk = response.read(min(CHUNK_SIZE, remaining))
+                    else:
+                        chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.limiter.consume(len(chunk))
+                    f.write(chunk)
+                    with self._lock:
+                        segment.done += len(chunk)
+
+            if self._stop.is_set():
+                # The rest of the body is unread, the connection can't be reused
+                connection.close()
+                return
+            if segment.end >= 0 and not segment.finished:
+                raise http.client.IncompleteRead(b"", segment.end + 1 - segment.start)
+            if segment.end < 0:
+                # The size was unknown, now it is whatever we received
+                segment.end = segment.start + segment.done - 1
+                self.state.size = segment.done
+            self.pool.put(url, connection)
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
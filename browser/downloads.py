@@ -0,0 +1,371 @@
+from collections import Counter
+from pathlib import Path
+from uuid import uuid4
+
+from PyQt6.QtCore import QObject, QStandardPaths, QTimer, QUrl, pyqtSignal
+from PyQt6.QtNetwork import QNetworkCookie
+from PyQt6.QtWebEngineCore import (
+    QWebEngineDownloadRequest,
+    QWebEnginePage,
+    QWebEngineProfile,
+)
+from PyQt6.QtWidgets import (
+    QHBoxLayout,
+    QLabel,
+    QProgressBar,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+)
+
+from browser.downloader import (
+    ConnectionPool,
+    DownloadState,
+    RateLimiter,
+    SegmentedDownload,
+)
+from browser.utils import Config, setup_logging
+
+RequestState = QWebEngineDownloadRequest.DownloadState
+
+
+def format_size(size: float) -> str:
+    if size < 1024:
+        return f"{size:.0f} B"
+    for unit in ("KB", "MB"):
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} GB"
+
+
+def unique_path(directory: Path, filename: str) -> Path:
+    """Pick a file name that doesn't clash with an existing download"""
+    path = directory / filename
+    counter = 1
+    while path.exists() or Path(str(path) + ".part").exists():
+        path = directory / f"{Path(filename).stem} ({counter}){Path(filename).suffix}"
+        counter += 1
+    return path
+
+
+class DownloadRow(QWidget):
+    """One download in the panel, either a QtWebEngine or a segmented one"""
+
+    def __init__(
+        self,
+        request: QWebEngineDownloadRequest | None = None,
+        download: SegmentedDownload | None = None,
+        parent: QWidget | None = None,
+    ) -> None:
+        super().__init__(parent)
+        self.request = request
+        self.download = download
+        self._last_received = 0
+
+        self.name_label = QLabel(self._filename())
+        self.progress_bar = QProgressBar()
+        self.status_label = QLabel()
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(self.cancel)
+
+        layout = QHBoxLayout(self)
+        layout.addWidget(self.name_label, 2)
+        layout.addWidget(self.progress_bar, 3)
+        layout.addWidget(self.status_label, 2)
+        layout.addWidget(self.pause_btn)
+        layout.addWidget(self.cancel_btn)
+
+    def _filename(self) -> str:
+        if self.download:
+            return Path(self.download.state.path).name
+        if self.request:
+            return self.request.downloadFileName()
+        return ""
+
+    def _progress(self) -> tuple[int, int, str, bool]:
+        """Received bytes, total bytes, status text and whether it is running"""
+        if self.download:
+            state = self.download.state
+            status = state.error if state.status == "failed" else state.status
+            return (
+                self.download.received,
+                state.size or 0,
+                status or "failed",
+                self.download.is_active,
+            )
+
+        if self.request:
+            request_state = self.request.state()
+            if self.request.isPaused():
+                status = "paused"
+            elif request_state == RequestState.DownloadCompleted:
+                status = "finished"
+            elif request_state == RequestState.DownloadCancelled:
+                status = "cancelled"
+            elif request_state == RequestState.DownloadInterrupted:
+                status = self.request.interruptReasonString()
+            else:
+                status = "downloading"
+            running = request_state == RequestState.DownloadInProgress
+            return (
+                self.request.receivedBytes(),
+                max(self.request.totalBytes(), 0),
+                status,
+                running and not self.request.isPaused(),
+            )
+
+        return 0, 0, "", False
+
+    def refresh(self, interval: float) -> None:
+        received, total, status, running = self._progress()
+        speed = max(received - self._last_received, 0) / interval
+        self._last_received = received
+
+        if total > 0:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(int(received / total * 1000))
+            progress = f"{format_size(received)} of {format_size(total)}"
+        else:
+            # Unknown size, show a busy indicator
+            self.progress_bar.setRange(0, 0 if running else 1)
+            progress = format_size(received)
+
+        if running:
+            self.status_label.setText(f"{progress}, {format_size(speed)}/s")
+        else:
+            self.status_label.setText(f"{progress}, {status}")
+
+        finished = status in ("finished", "cancelled")
+        self.pause_btn.setText("Pause" if running else "Resume")
+        self.pause_btn.setEnabled(not finished)
+        self.cancel_btn.setEnabled(not finished)
+
+    def toggle_pause(self) -> None:
+        if self.download:
+            if self.download.is_active:
+                self.download.pause()
+            else:
+                self.download.start()
+        elif self.request:
+            if self.request.isPaused():
+                self.request.resume()
+            else:
+                self.request.pause()
+
+    def cancel(self) -> None:
+        if self.download:
+            self.download.cancel()
+            self.download.state.status = "failed"
+            self.download.state.error = "cancelled"
+        elif self.request:
+            self.request.cancel()
+
+
+class DownloadsPanel(QWidget):
+    """Window listing downloads with their progress"""
+
+    def __init__(self, parent: QWidget | None = None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("Downloads")
+        self.resize(700, 300)
+        self.rows: list[DownloadRow] = []
+
+        self._layout = QVBoxLayout(self)
+        self._layout.addStretch()
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(500)
+        self._timer.timeout.connect(self.refresh)
+
+    def add_row(self, row: DownloadRow) -> None:
+        self.rows.append(row)
+        self._layout.insertWidget(self._layout.count() - 1, row)
+        row.refresh(self._timer.interval() / 1000)
+
+    def remove_row(self, row: DownloadRow) -> None:
+        self.rows.remove(row)
+        self._layout.removeWidget(row)
+        row.deleteLater()
+
+    def refresh(self) -> None:
+        for row in self.rows:
+            row.refresh(self._timer.interval() / 1000)
+
+    def showEvent(self, a0) -> None:
+        self._timer.start()
+        super().showEvent(a0)
+
+    def hideEvent(self, a0) -> None:
+        self._timer.stop()
+        super().hideEvent(a0)
+
+    def toggle(self) -> None:
+        if self.isVisible():
+            self.hide()
+        else:
+            self.show()
+            self.raise_()
+
+
+class DownloadManager(QObject):
+    """Handles the profile's downloads, segmenting big ones over HTTP ranges"""
+
+    # A segmented download whose server turned out not to support ranges
+    ranges_unsupported = pyqtSignal(object)
+
+    def __init__(
+        self, profile: QWebEngineProfile, parent: QObject | None = None
+    ) -> None:
+        super().__init__(parent)
+        self.config = Config.load()
+        self.logger = setup_logging()
+        self.profile = profile
+
+        download_dir = (
+            self.config.download_directory
+            or QStandardPaths.writableLocation(
+                QStandardPaths.StandardLocation.DownloadLocation
+            )
+        )
+        self.download_dir = Path(download_dir)
+        self.state_dir = Path(__file__).parent.parent / "data" / "downloads"
+
+        self.pool = ConnectionPool()
+        self.limiter = RateLimiter(self.config.download_bandwidth_kbps * 1024)
+        self.downloads: list[SegmentedDownload] = []
+        self.panel = DownloadsPanel()
+
+        # URLs given back to QtWebEngine, not to be taken over again
+        self.handed_back: set[str] = set()
+        self.ranges_unsupported.connect(self.hand_back)
+        # Downloads are started from a page, this one is never shown
+        self._download_page: QWebEnginePage | None = None
+
+        # Our own connections carry no cookies, so hosts that set any are left
+        # to QtWebEngine, a login page would be saved instead of the file
+        self.cookie_domains: Counter[str] = Counter()
+        cookie_store = profile.cookieStore()
+        if cookie_store:
+            cookie_store.cookieAdded.connect(self._on_cookie_added)
+            cookie_store.cookieRemoved.connect(self._on_cookie_removed)
+            cookie_store.loadAllCookies()
+
+        profile.downloadRequested.connect(self.on_download_requested)
+        self.load_unfinished()
+
+    def load_unfinished(self) -> None:
+        """Bring back segmented downloads interrupted in an earlier session"""
+        if not self.state_dir.exists():
+            return
+        for state_file in sorted(self.state_dir.glob("*.json")):
+            try:
+                download = SegmentedDownload.load(
+                    state_file, self.pool, self.limiter, **self._download_options()
+                )
+            except Exception as e:
+                self.logger.warning(f"[WARN] Could not restore {state_file}: {e}")
+                continue
+            self.downloads.append(download)
+            self.panel.add_row(DownloadRow(download=download))
+            self.logger.info(f"Restored paused download of {download.state.url}")
+
+    def _download_options(self) -> dict:
+        return {
+            "connections": max(1, self.config.download_segments),
+            "min_segment_size": 1024 * 1024,
+            "on_ranges_unsupported": self.ranges_unsupported.emit,
+        }
+
+    def _on_cookie_added(self, cookie: QNetworkCookie) -> None:
+        self.cookie_domains[cookie.domain().lstrip(".").lower()] += 1
+
+    def _on_cookie_removed(self, cookie: QNetworkCookie) -> None:
+        domain = cookie.domain().lstrip(".").lower()
+        self.cookie_domains[domain] -= 1
+        if self.cookie_domains[domain] <= 0:
+            del self.cookie_domains[domain]
+
+    def has_cookies(self, host: str) -> bool:
+        """Whether the profile has cookies that would be sent to the host"""
+        host = host.lower()
+        while host:
+            if host in self.cookie_domains:
+                return True
+            host = host.partition(".")[2]
+        return False
+
+    def on_download_requested(self, request: QWebEngineDownloadRequest) -> None:
+        url = request.url()
+        size = request.totalBytes()
+        min_size = self.config.segmented_download_min_mb * 1024 * 1024
+        handed_back = url.toString() in self.handed_back
+        self.handed_back.discard(url.toString())
+
+        if (
+            self.config.segmented_downloads
+            and not handed_back
+            and not request.isSavePageDownload()
+            and url.scheme() in ("http", "https")
+            and not url.userInfo()
+            and not self.has_cookies(url.host())
+            and size >= min_size
+        ):
+            # Take the download over from QtWebEngine
+            request.cancel()
+            path = unique_path(self.download_dir, request.downloadFileName())
+            page = request.page()
+            referer = page.url().toString() if page else None
+            self.start_segmented(url.toString(), path, referer)
+        else:
+            if not request.isSavePageDownload():
+                request.setDownloadDirectory(str(self.download_dir))
+            request.accept()
+            self.panel.add_row(DownloadRow(request=request))
+            self.logger.info(f"Downloading {url.toString()}")
+
+        self.panel.show()
+
+    def start_segmented(
+        self, url: str, path: Path, referer: str | None = None
+    ) -> SegmentedDownload:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        download = SegmentedDownload(
+            DownloadState(url=url, path=str(path), referer=referer),
+            self.state_dir / f"{uuid4().hex}.json",
+            self.pool,
+            self.limiter,
+            **self._download_options(),
+        )
+        self.downloads.append(download)
+        self.panel.add_row(DownloadRow(download=download))
+        download.start()
+        self.logger.info(f"Downloading {url} in segments to {path}")
+        return download
+
+    def hand_back(self, download: SegmentedDownload) -> None:
+        """Let QtWebEngine download what can't be segmented, with its cookies"""
+        url = download.state.url
+        self.logger.info(f"No range support for {url}, handing it back")
+        if download in self.downloads:
+            self.downloads.remove(download)
+        for row in self.panel.rows:
+            if row.download is download:
+                self.panel.remove_row(row)
+                break
+        self.handed_back.add(url)
+        if not self._download_page:
+            self._download_page = QWebEnginePage(self.profile, self)
+        self._download_page.download(QUrl(url), Path(download.state.path).name)
+
+    def shutdown(self) -> None:
+        """Pause running downloads so they can resume next session"""
+        active = [download for download in self.downloads if download.is_active]
+        for download in active:
+            download.pause()
+        # Long enough for the current chunks, not for a stalled server
+        for download in active:
+            download.wait(2)
+        self.pool.close()
@@ -0,0 +1,215 @@
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Iterable
+
+# Kept free of Qt so it can be benchmarked without a browser
+
+# ||host^ and nothing else, the bulk of the tracker lists
+PURE_HOST_RULE = re.compile(r"^\|\|([a-z0-9-]+(?:\.[a-z0-9-]+)+)\^$")
+ANCHORED_HOST = re.compile(r"^\|\|([a-z0-9.-]+)")
+# Separators of element hiding rules, e.g. example.com##.ad
+COSMETIC_SEPARATOR = re.compile(r"#[@?$%]*#")
+
+# Block rule options that change how other rules apply, always kept
+OVERRIDE_OPTIONS = ("important", "badfilter", "redirect")
+
+# Exception options that only affect element hiding, never network requests
+COSMETIC_OPTIONS = {
+    "elemhide",
+    "ehide",
+    "generichide",
+    "ghide",
+    "specifichide",
+    "shide",
+}
+
+
+@dataclass(frozen=True)
+class HostPrefilter:
+    """Hosts blocked by pure ||host^ rules, checked before the full engine"""
+
+    blocked: frozenset[str] = frozenset()
+    # Label left of the last dot of every blocked host, e.g. "tracker" for
+    # ads.tracker.com, any host they block has the same one
+    blocked_labels: frozenset[str] = frozenset()
+    # Anything an exception or redirect rule could apply to goes to the engine
+    exception_hosts: frozenset[str] = frozenset()
+    exception_first_parties: frozenset[str] = frozenset()
+    exception_tokens: tuple[str, ...] = ()
+
+    def __len__(self) -> int:
+        return len(self.blocked)
+
+    def blocking_domain(self, url: str, host: str, source_host: str) -> str | None:
+        """Domain of the pure host rule blocking the request, if no exception can apply"""
+        # Most requests go to hosts no rule names, one lookup rules them out
+        if host.rpartition(".")[0].rpartition(".")[2] not in self.blocked_labels:
+            return None
+
+        matched = None
+        while host:
+            if host in self.exception_hosts:
+                return None
+            if not matched and host in self.blocked:
+                matched = host
+            host = host.partition(".")[2]
+        if not matched:
+            return None
+
+        while source_host:
+            if source_host in self.exception_first_parties:
+                return None
+            source_host = source_host.partition(".")[2]
+
+        if self.exception_tokens:
+            url = url.lower()
+            if any(token in url for token in self.exception_tokens):
+                return None
+        return matched
+
+
+def build_host_prefilter(rules: Iterable[str]) -> HostPrefilter:
+    """Collect the pure host rules of filter lists and what could override them"""
+    blocked: set[str] = set()
+    bad_hosts: set[str] = set()
+    exception_hosts: set[str] = set()
+    exception_first_parties: set[str] = set()
+    exception_tokens: set[str] = set()
+
+    for line in rules:
+        rule = line.strip().lower()
+        if not rule or rule.startswith(("!", "[")) or COSMETIC_SEPARATOR.search(rule):
+            continue
+
+        if rule.startswith("@@"):
+            rule = rule[2:]
+        else:
+            if not rule.startswith("||"):
+                # Most rules, skipped without running the regexes
+                if "redirect" not in rule.partition("$")[2]:
+                    continue
+            match = PURE_HOST_RULE.match(rule)
+            if match:
+                blocked.add(match.group(1))
+                continue
+            match = PURE_HOST_RULE.match(rule.removesuffix("$badfilter"))
+            if match:
+                bad_hosts.add(match.group(1))
+                continue
+            # Other block rules only matter when the engine may answer with a
+            # redirect to a stub instead of blocking
+            if "redirect" not in rule.partition("$")[2]:
+                continue
+
+        pattern, _, option_text = rule.partition("$")
+        options = option_text.split(",") if option_text else []
+        if options and all(option in COSMETIC_OPTIONS for option in options):
+            continue
+
+        match = ANCHORED_HOST.match(pattern)
+        if match:
+            exception_hosts.add(match.group(1).strip("."))
+            if "document" in options:
+                exception_first_parties.add(match.group(1).strip("."))
+            continue
+
+        # Unanchored rules either name the sites they apply on...
+        domains = [
+            domain
+            for option in options
+            if option.startswith("domain=")
+            for domain in option.removeprefix("domain=").split("|")
+            if not domain.startswith("~")
+        ]
+        if domains:
+            exception_first_parties.update(domains)
+            continue
+
+        # ...or apply everywhere, then the URL must not contain their text
+        is_regex = (
+            len(pattern) > 1 and pattern.startswith("/") and pattern.endswith("/")
+        )
+        token = "" if is_regex else max(re.split(r"[*^|]", pattern), key=len)
+        if not token:
+            # Could match any URL, leave every request to the engine
+            return HostPrefilter()
+        exception_tokens.add(token)
+
+    blocked -= bad_hosts
+    return HostPrefilter(
+        blocked=frozenset(blocked),
+        blocked_labels=frozenset(
+            host.rpartition(".")[0].rpartition(".")[2] for host in blocked
+        ),
+        exception_hosts=frozenset(exception_hosts),
+        exception_first_parties=frozenset(exception_first_parties),
+        exception_tokens=tuple(sorted(exception_tokens)),
+    )
+
+
+@dataclass
+class RuleHits:
+    """The last day each filter rule matched, kept across sessions"""
+
+    path: Path
+    last_hit: dict[str, str] = field(default_factory=dict)
+    # Date, rule count, build time and size of the last full engine
+    full_build: dict[str, Any] = field(default_factory=dict)
+    dirty: bool = False
+
+    @classmethod
+    def load(cls, path: Path) -> "RuleHits":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return cls(path)
+        return cls(path, data.get("last_hit", {}), data.get("full_build", {}))
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.path.with_suffix(".tmp")
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"full_build": self.full_build, "last_hit": self.last_hit}, f)
+        temp_file.replace(self.path)
+        self.dirty = False
+
+    def record(self, rule: str) -> None:
+        today = date.today().isoformat()
+        if self.last_hit.get(rule) != today:
+            self.last_hit[rule] = today
+            self.dirty = True
+
+    def recent(self, days: int) -> set[str]:
+        """Rules that matched in the last days"""
+        since = (date.today() - timedelta(days=days)).isoformat()
+        return {rule for rule, day in self.last_hit.items() if day >= since}
+
+    def full_build_due(self, days: int) -> bool:
+        built = self.full_build.get("date")
+        if not built:
+            return True
+        return built <= (date.today() - timedelta(days=days)).isoformat()
+
+
+def compact_rules(rules: Iterable[str], keep: set[str]) -> list[str]:
+    """Network rules in keep, plus every exception and override rule"""
+    compact: list[str] = []
+    for line in rules:
+        rule = line.strip()
+        # Element hiding rules are never used, the engine only sees requests
+        if not rule or rule.startswith(("!", "[")) or COSMETIC_SEPARATOR.search(rule):
+            continue
+        options = rule.partition("$")[2]
+        if (
+            rule in keep
+            or rule.startswith("@@")
+            or any(option in options for option in OVERRIDE_OPTIONS)
+        ):
+            compact.append(rule)
+    return compact
@@ -1,15 +1,24 @@
 from datetime import datetime
 import json
 from pathlib import Path
+from typing import Protocol
 from urllib.parse import urlparse
 import hashlib
 
-from PyQt6.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt6.QtCore import QBuffer, QByteArray, QIODevice, QUrl
 from PyQt6.QtGui import QIcon
 
 from url_normalize import url_normalize
 
-from browser.qt import WebPage
+
+class HistoryPage(Protocol):
+    """What the history reads from a page, so it works without QtWebEngine"""
+
+    def url(self) -> QUrl: ...
+
+    def title(self) -> str: ...
+
+    def icon(self) -> QIcon: ...
 
 
 def qicon_to_base64(icon: QIcon, size: tuple = (24, 24)) -> str:
@@ -34,11 +43,15 @@ def get_favicon_id(domain: str) -> str:
     return f"fav_{domain_hash}"
 
 
-def append_to_history(page: WebPage):
+def canonical_url(url: str) -> str:
+    """The form URLs are counted under in the history"""
+    return url_normalize(url) or url
+
+
+def append_to_history(page: HistoryPage, data_dir: Path | None = None):
     """Append to the history file"""
 
-    root_dir = Path(__file__).parent.parent
-    data_dir = root_dir / "data"
+    data_dir = data_dir or Path(__file__).parent.parent / "data"
     data_dir.mkdir(parents=True, exist_ok=True)
 
     history_file = data_dir / "history.json"
@@ -49,9 +62,9 @@ def append_to_history(page: WebPage):
         history = {}
 
     url = page.url().url()
-    canonical_url = url_normalize(url) or url
+    canonical = canonical_url(url)
 
-    parsed = urlparse(canonical_url)
+    parsed = urlparse(canonical)
     domain = parsed.netloc.replace("www.", "")
 
     now = datetime.now()
@@ -62,7 +75,7 @@ def append_to_history(page: WebPage):
 
     existing_entry = None
     for item in history[str_date]:
-        if item["canonical_url"] == canonical_url:
+        if item["canonical_url"] == canonical:
             existing_entry = item
             break
 
@@ -74,7 +87,7 @@ def append_to_history(page: WebPage):
             {
                 "title": page.title(),
                 "url": url,
-                "canonical_url": canonical_url,
+                "canonical_url": canonical,
                 "favicon_id": get_favicon_id(domain),
                 "visits": [now.timestamp()],
             }
@@ -86,11 +99,12 @@ def append_to_history(page: WebPage):
     return history
 
 
-def append_to_favicons(page: WebPage, icon: QIcon | None = None):
+def append_to_favicons(
+    page: HistoryPage, icon: QIcon | None = None, data_dir: Path | None = None
+):
     """Append to the favicon file"""
 
-    root_dir = Path(__file__).parent.parent
-    data_dir = root_dir / "data"
+    data_dir = data_dir or Path(__file__).parent.parent / "data"
     data_dir.mkdir(parents=True, exist_ok=True)
 
     favicon = icon or page.icon()
@@ -103,9 +117,9 @@ def append_to_favicons(page: WebPage, icon: QIcon | None = None):
         favicons = {}
 
     url = page.url().url()
-    canonical_url = url_normalize(url) or url
+    canonical = canonical_url(url)
 
-    parsed = urlparse(canonical_url)
+    parsed = urlparse(canonical)
     domain = parsed.netloc.replace("www.", "")
 
     favicon_id = get_favicon_id(domain)
@@ -131,3 +145,23 @@ def append_to_favicons(page: WebPage, icon: QIcon | None = None):
         json.dump(clean_favicons, f, indent=2)
 
     return clean_favicons
+
+
+def get_visit_counts(data_dir: Path | None = None) -> dict[str, int]:
+    """Count visits per URL across the whole history file"""
+
+    data_dir = data_dir or Path(__file__).parent.parent / "data"
+    history_file = data_dir / "history.json"
+    if not history_file.exists():
+        return {}
+
+    with open(history_file, "r") as f:
+        history = json.load(f)
+
+    counts: dict[str, int] = {}
+    for entries in history.values():
+        for item in entries:
+            url = item["canonical_url"]
+            counts[url] = counts.get(url, 0) + len(item["visits"])
+
+    return counts
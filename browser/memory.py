@@ -0,0 +1,140 @@
+import gc
+from typing import Callable
+
+import psutil
+from PyQt6.QtCore import QObject, QTimer
+from PyQt6.QtGui import QPixmapCache
+
+from browser.qt import WebView
+from browser.tabs import Tabs
+from browser.utils import Config, setup_logging
+
+
+def renderer_pid(web_view: WebView) -> int | None:
+    page = web_view.page()
+    if not page:
+        return None
+    pid = page.renderProcessPid()
+    return pid or None
+
+
+def renderer_memory_mb(web_view: WebView) -> float | None:
+    """Resident memory of the renderer process behind a view"""
+    pid = renderer_pid(web_view)
+    if pid is None:
+        return None
+    try:
+        rss = psutil.Process(pid).memory_info().rss
+    except psutil.Error:
+        return None
+    return rss / (1024**2)
+
+
+def process_memory_mb() -> float:
+    """Resident memory of the browser process itself"""
+    return psutil.Process().memory_info().rss / (1024**2)
+
+
+class MemoryGovernor(QObject):
+    """Trims caches and discards background tabs when memory runs low"""
+
+    def __init__(self, tabs: Tabs, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.config = Config.load()
+        self.logger = setup_logging()
+        self.tabs = tabs
+        self.trimmers: dict[str, Callable[[], None]] = {
+            "pixmap cache": QPixmapCache.clear,
+        }
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.check)
+        self.configure()
+
+    def configure(self) -> None:
+        """Start, restart or stop the checks according to the config"""
+        if self.config.memory_budget_mb > 0 or self.config.memory_min_free_percent > 0:
+            self._timer.start(self.config.memory_check_interval * 1000)
+        else:
+            self._timer.stop()
+
+    def register_trimmer(self, name: str, trim: Callable[[], None]) -> None:
+        """Add a cache that gets cleared when over budget"""
+        self.trimmers[name] = trim
+
+    def renderers_memory_mb(self) -> float:
+        """Resident memory of all renderer processes, each counted once"""
+        pids: set[int] = set()
+        for i in range(self.tabs.count()):
+            web_view = self.tabs.widget(i)
+            if isinstance(web_view, WebView):
+                pid = renderer_pid(web_view)
+                if pid:
+                    pids.add(pid)
+
+        total = 0
+        for pid in pids:
+            try:
+                total += psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024**2)
+
+    def used_memory_mb(self) -> float:
+        return process_memory_mb() + self.renderers_memory_mb()
+
+    def over_budget(self) -> str | None:
+        """Describe how the budget is exceeded, or None when within it"""
+        budget = self.config.memory_budget_mb
+        if budget > 0:
+            used = self.used_memory_mb()
+            if used > budget:
+                return f"using {used:.0f} MB of a {budget} MB budget"
+
+        min_free = self.config.memory_min_free_percent
+        if min_free > 0:
+            mem = psutil.virtual_memory()
+            free = mem.available / mem.total * 100
+            if free < min_free:
+                return f"{free:.1f}% memory free, below {min_free}%"
+
+        return None
+
+    def check(self) -> None:
+        reason = self.over_budget()
+        if not reason:
+            return
+        self.logger.warning(f"[WARN] Memory pressure: {reason}")
+
+        self.trim_caches()
+        if not self.over_budget():
+            return
+
+        # Only one tab per check, the renderer needs time to give memory back
+        for web_view in self.tabs.background_tabs_by_lru():
+            page = web_view.page()
+            if not page or page.recentlyAudible():
+                continue
+            before = self.used_memory_mb()
+            url = web_view.url().toString()
+            self.tabs.discard_tab(web_view)
+            QTimer.singleShot(2000, lambda: self._log_discard_reclaimed(url, before))
+            break
+
+    def trim_caches(self) -> None:
+        """Clear every registered cache, logging what each one gave back"""
+        for name, trim in self.trimmers.items():
+            before = process_memory_mb()
+            try:
+                trim()
+            except Exception as e:
+                self.logger.warning(f"[WARN] Trimming {name} failed: {e}")
+                continue
+            gc.collect()
+            self.logger.info(
+                f"Memory: trimmed {name}, reclaimed {before - process_memory_mb():.1f} MB"
+            )
+
+    def _log_discard_reclaimed(self, url: str, before: float) -> None:
+        reclaimed = before - self.used_memory_mb()
+        self.logger.info(f"Memory: discarded {url}, reclaimed {reclaimed:.1f} MB")
@@ -0,0 +1,155 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+from PyQt6.QtCore import QObject, QTimer
+
+from browser.utils import setup_logging
+
+PROFILES_DIR = Path(__file__).parent.parent / "data" / "profiles"
+
+
+def _timestamp() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class Profiler:
+    """On-demand cProfile of the GUI thread and tracemalloc snapshot diffs"""
+
+    def __init__(self, profiles_dir: Path = PROFILES_DIR) -> None:
+        self.logger = setup_logging()
+        self.profiles_dir = profiles_dir
+        self.profile: cProfile.Profile | None = None
+        self.snapshot: tracemalloc.Snapshot | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None
+
+    def toggle(self) -> Path | None:
+        """Start profiling, or stop and dump the .prof file it collected"""
+        # Must run on the GUI thread, cProfile only sees the thread it runs on
+        if self.profile is None:
+            self.logger.info("Profiler started, toggle again to save the profile")
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            return None
+
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+        prof_file = self.profiles_dir / f"gui-{_timestamp()}.prof"
+        profile.dump_stats(prof_file)
+
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(15)
+        self.logger.info(f"Profile written to {prof_file}\n{summary.getvalue()}")
+        return prof_file
+
+    def memory_snapshot(self) -> Path | None:
+        """Take a snapshot and write what grew since the previous one"""
+        if not tracemalloc.is_tracing():
+            # Only allocations from here on are seen, so start with a baseline
+            tracemalloc.start(25)
+            self.snapshot = self._take_snapshot()
+            self.logger.info("Memory tracing started, take another snapshot to diff")
+            return None
+
+        snapshot = self._take_snapshot()
+        previous = self.snapshot
+        self.snapshot = snapshot
+        if previous is None:
+            return None
+        stats = snapshot.compare_to(previous, "lineno")
+
+        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+        diff_file = self.profiles_dir / f"memory-{_timestamp()}.txt"
+        current, peak = tracemalloc.get_traced_memory()
+        with open(diff_file, "w", encoding="utf-8") as f:
+            f.write(
+                f"Traced: {current / 1024**2:.1f} MB now, {peak / 1024**2:.1f} MB peak\n"
+                f"Growth since the previous snapshot, largest first:\n\n"
+            )
+            for stat in stats[:50]:
+                f.write(f"{stat}\n")
+
+        top = "\n".join(f"  {stat}" for stat in stats[:5])
+        self.logger.info(f"Memory diff written to {diff_file}\n{top}")
+        return diff_file
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ]
+        )
+
+
+class SlowHandlerWatchdog(QObject):
+    """Logs the GUI thread's stack whenever a handler blocks the event loop"""
+
+    def __init__(self, threshold_ms: int, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.logger = setup_logging()
+        self.threshold = threshold_ms / 1000
+        self.interval = max(threshold_ms // 4, 10) / 1000
+        self.gui_thread_id = threading.get_ident()
+        self.slow_handlers = 0
+
+        # The heartbeat only gets through when the event loop is free
+        self._last_beat = time.monotonic()
+        self._reported = False
+        self._heartbeat = QTimer(self)
+        self._heartbeat.setInterval(int(self.interval * 1000))
+        self._heartbeat.timeout.connect(self._beat)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._watch, name="slow handler watchdog", daemon=True
+        )
+
+    def start(self) -> None:
+        self._last_beat = time.monotonic()
+        self._heartbeat.start()
+        self._thread.start()
+        self.logger.info(
+            f"Slow handler watchdog on, threshold {self.threshold * 1000:.0f} ms"
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._heartbeat.stop()
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        if self._reported:
+            blocked = (now - self._last_beat - self.interval) * 1000
+            self.logger.warning(f"[WARN] GUI thread was blocked for {blocked:.0f} ms")
+            self._reported = False
+        self._last_beat = now
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            # Late by more than the threshold after the beat was due
+            late = time.monotonic() - self._last_beat - self.interval
+            if late < self.threshold or self._reported:
+                continue
+            frame = sys._current_frames().get(self.gui_thread_id)
+            if frame is None or frame.f_code.co_name == "main":
+                # Only the event loop itself is running, no handler of ours
+                continue
+            self._reported = True
+            self.slow_handlers += 1
+            stack = "".join(traceback.format_stack(frame))
+            self.logger.warning(
+                f"[WARN] GUI thread busy for over {late * 1000:.0f} ms in:\n{stack}"
+            )
@@ -1,6 +1,6 @@
 from collections.abc import Callable
 from typing import Any, TypeAlias
-from PyQt6.QtCore import pyqtBoundSignal
+from PyQt6.QtCore import QUrl, pyqtBoundSignal
 from PyQt6.QtGui import QAction, QColor, QIcon, QPalette
 from PyQt6.QtWebEngineCore import QWebEnginePage
 from PyQt6.QtWidgets import QToolButton, QWidget
@@ -13,7 +13,26 @@ from browser.utils import (
 )
 
 WebView: TypeAlias = QWebEngineView
-WebPage: TypeAlias = QWebEnginePage
+
+
+class WebPage(QWebEnginePage):
+    """Page that can prepare itself for each main frame navigation"""
+
+    # Called with the target URL of every main frame navigation, including
+    # link clicks and redirects, before the new document loads
+    before_navigation: Callable[["WebPage", QUrl], None] | None = None
+
+    def acceptNavigationRequest(
+        self,
+        url: QUrl,
+        type: QWebEnginePage.NavigationType,
+        isMainFrame: bool,
+    ) -> bool:
+        if isMainFrame and self.before_navigation:
+            self.before_navigation(self, url)
+        return super().acceptNavigationRequest(url, type, isMainFrame)
+
+
 WebAction: TypeAlias = WebPage.WebAction
 
 
@@ -0,0 +1 @@
+(function() {})();
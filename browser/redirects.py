@@ -0,0 +1,88 @@
+import base64
+from pathlib import Path
+
+import adblock
+from PyQt6.QtCore import QBuffer, QByteArray, QObject, QUrl
+from PyQt6.QtWebEngineCore import (
+    QWebEngineUrlRequestJob,
+    QWebEngineUrlScheme,
+    QWebEngineUrlSchemeHandler,
+)
+
+from browser.utils import setup_logging
+
+RESOURCE_SCHEME = b"veil-resource"
+RESOURCES_DIR = Path(__file__).parent / "redirect_resources"
+
+# Stubs blocked requests can be answered with: file -> (type, rule aliases)
+REDIRECT_RESOURCES: dict[str, tuple[str, list[str]]] = {
+    "noop.js": ("application/javascript", ["noopjs"]),
+    "noop.css": ("text/css", ["noopcss"]),
+    "1x1.gif": ("image/gif", ["1x1-transparent.gif"]),
+    "noop.html": ("text/html", ["noopframe"]),
+    "noop.txt": ("text/plain", ["nooptext"]),
+}
+
+
+def register_resource_scheme() -> None:
+    """Declare the stub scheme, must run before the QApplication is created"""
+    scheme = QWebEngineUrlScheme(RESOURCE_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Path)
+    # Loadable from any https page, whatever its CSP allows
+    scheme.setFlags(
+        QWebEngineUrlScheme.Flag.SecureScheme
+        | QWebEngineUrlScheme.Flag.CorsEnabled
+        | QWebEngineUrlScheme.Flag.ContentSecurityPolicyIgnored
+    )
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class RedirectResources(QWebEngineUrlSchemeHandler):
+    """Serves bundled no-op stubs in place of blocked scripts, images and frames"""
+
+    def __init__(self, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.logger = setup_logging()
+        self.resources: dict[str, tuple[str, bytes]] = {}
+        # The engine answers redirects with data: URLs, whose type it may
+        # rewrite, so they are mapped back to ours by their content
+        self.urls: dict[str, QUrl] = {}
+        self.redirected = 0
+
+        for name, (content_type, _) in REDIRECT_RESOURCES.items():
+            try:
+                content = (RESOURCES_DIR / name).read_bytes()
+            except OSError as e:
+                self.logger.warning(f"[WARN] Missing redirect resource {name}: {e}")
+                continue
+            self.resources[name] = (content_type, content)
+            encoded = base64.b64encode(content).decode()
+            self.urls[encoded] = QUrl(f"{RESOURCE_SCHEME.decode()}:{name}")
+
+    def add_to(self, engine: adblock.Engine) -> None:
+        """Make the stubs available to an engine's $redirect rules"""
+        for name, (content_type, content) in self.resources.items():
+            engine.add_resource(
+                name,
+                content_type,
+                base64.b64encode(content).decode(),
+                REDIRECT_RESOURCES[name][1],
+            )
+
+    def url_for(self, redirect: str | None) -> QUrl | None:
+        if not redirect:
+            return None
+        return self.urls.get(redirect.partition(";base64,")[2])
+
+    def requestStarted(self, a0: QWebEngineUrlRequestJob | None) -> None:
+        if not a0:
+            return
+        resource = self.resources.get(a0.requestUrl().path())
+        if not resource:
+            a0.fail(QWebEngineUrlRequestJob.Error.UrlNotFound)
+            return
+
+        content_type, content = resource
+        buffer = QBuffer(a0)
+        buffer.setData(QByteArray(content))
+        a0.reply(content_type.encode(), buffer)
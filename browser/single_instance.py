@@ -0,0 +1,114 @@
+import getpass
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from PyQt6.QtCore import QObject, QUrl, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+from browser.utils import setup_logging
+
+# Kept free of Qt WebEngine, a forwarding launch exits before loading it
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+# How long a second launch waits on the running browser
+CONNECT_TIMEOUT_MS = 200
+REPLY_TIMEOUT_MS = 1000
+
+
+def server_name() -> str:
+    """One socket per user and per data directory"""
+    data_dir = hashlib.sha1(str(DATA_DIR.resolve()).encode()).hexdigest()[:8]
+    return f"veil-browser-{getpass.getuser()}-{data_dir}"
+
+
+def url_from_argument(argument: str | None) -> str | None:
+    """Make a command line URL or file path absolute, whichever the cwd"""
+    if not argument:
+        return None
+    url = QUrl.fromUserInput(argument, os.getcwd())
+    return url.toString() if url.isValid() else argument
+
+
+def forward_to_running_instance(url: str | None) -> bool:
+    """Ask an already running browser to open the URL, True if it did"""
+    logger = setup_logging()
+    socket = QLocalSocket()
+    socket.connectToServer(server_name())
+    if not socket.waitForConnected(CONNECT_TIMEOUT_MS):
+        # Nobody listening, or a stale socket left by a crash
+        return False
+
+    socket.write(json.dumps({"open": url}).encode() + b"\n")
+    socket.flush()
+    replied = socket.waitForReadyRead(REPLY_TIMEOUT_MS)
+    reply = bytes(socket.readLine().data()).strip() if replied else b""
+    socket.disconnectFromServer()
+    if reply != b"ok":
+        logger.warning("[WARN] Running instance did not answer, starting another")
+        return False
+    logger.info(f"Opened {url or 'a new tab'} in the running instance")
+    return True
+
+
+def is_listening(name: str) -> bool:
+    socket = QLocalSocket()
+    socket.connectToServer(name)
+    connected = socket.waitForConnected(CONNECT_TIMEOUT_MS)
+    socket.abort()
+    return connected
+
+
+class InstanceServer(QObject):
+    """Listens for later launches and hands their URLs to the browser"""
+
+    # URL to open in a new tab, or None for the homepage
+    open_requested = pyqtSignal(object)
+
+    def __init__(self, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.logger = setup_logging()
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self.server.newConnection.connect(self._on_new_connection)
+
+    def listen(self) -> bool:
+        name = server_name()
+        # Checked first, listening with socket options replaces a live socket
+        if is_listening(name):
+            # Another browser got there first, or answered us too slowly
+            self.logger.warning(
+                "[WARN] Another instance is running, not listening for launches"
+            )
+            return False
+        # Nobody answers on it, so a crashed browser may have left it behind
+        QLocalServer.removeServer(name)
+        if not self.server.listen(name):
+            self.logger.warning(
+                f"[WARN] Single instance server failed: {self.server.errorString()}"
+            )
+            return False
+        return True
+
+    def _on_new_connection(self) -> None:
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            if not socket:
+                continue
+            socket.readyRead.connect(lambda socket=socket: self._on_ready_read(socket))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def _on_ready_read(self, socket: QLocalSocket) -> None:
+        if not socket.canReadLine():
+            return
+        try:
+            request = json.loads(bytes(socket.readLine().data()))
+            url = request["open"]
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"[WARN] Bad single instance request: {e}")
+            socket.disconnectFromServer()
+            return
+        socket.write(b"ok\n")
+        socket.flush()
+        self.open_requested.emit(url if isinstance(url, str) else None)
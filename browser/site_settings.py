@@ -0,0 +1,98 @@
+import json
+from pathlib import Path
+
+from PyQt6.QtCore import QUrl
+from PyQt6.QtWebEngineCore import QWebEnginePage, QWebEngineSettings
+
+from browser.utils import Config, HostTrie, setup_logging
+
+WebAttribute = QWebEngineSettings.WebAttribute
+
+# Setting name -> (attribute, whether the attribute means the opposite)
+SITE_ATTRIBUTES: dict[str, tuple[WebAttribute, bool]] = {
+    "javascript": (WebAttribute.JavascriptEnabled, False),
+    "images": (WebAttribute.AutoLoadImages, False),
+    "autoplay": (WebAttribute.PlaybackRequiresUserGesture, True),
+    "plugins": (WebAttribute.PluginsEnabled, False),
+    "webgl": (WebAttribute.WebGLEnabled, False),
+    "local_storage": (WebAttribute.LocalStorageEnabled, False),
+}
+
+# What lite mode turns off on sites without their own settings
+LITE_MODE_SETTINGS: dict[str, bool] = {
+    "javascript": False,
+    "images": False,
+    "autoplay": False,
+    "plugins": False,
+    "webgl": False,
+}
+
+
+class SiteSettings:
+    """Per-domain web settings from data/site_settings.json, plus lite mode"""
+
+    def __init__(self) -> None:
+        self.logger = setup_logging()
+        self.lite_mode = Config.load().lite_mode
+        self.settings_file = Path(__file__).parent.parent / "data/site_settings.json"
+        self.defaults: dict[str, bool] | None = None
+        self.trie: HostTrie[dict[str, bool]] = HostTrie()
+        self.load()
+
+    def load(self) -> None:
+        """Read the per-domain table, e.g. {"example.com": {"javascript": false}}"""
+        if not self.settings_file.exists():
+            self.settings_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.settings_file, "w") as f:
+                json.dump({}, f, indent=2)
+
+        try:
+            with open(self.settings_file, "r") as f:
+                sites: dict[str, dict[str, bool]] = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.warning(f"[WARN] Could not read site settings: {e}")
+            sites = {}
+
+        for domain, settings in sites.items():
+            unknown = set(settings) - set(SITE_ATTRIBUTES)
+            if unknown:
+                self.logger.warning(
+                    f"[WARN] Unknown site settings for {domain}: {', '.join(unknown)}"
+                )
+        self.trie = HostTrie(sites)
+
+    def settings_for(self, url: QUrl) -> dict[str, bool]:
+        """Settings for a URL: defaults, then lite mode, then the site's own"""
+        settings = dict(self.defaults or {})
+        site = self.trie.lookup(url.host()) if url.host() else None
+        if self.lite_mode and site is None:
+            settings.update(LITE_MODE_SETTINGS)
+        if site:
+            settings.update(
+                {name: on for name, on in site.items() if name in SITE_ATTRIBUTES}
+            )
+        return settings
+
+    def apply(self, page: QWebEnginePage, url: QUrl) -> None:
+        """Set the page's attributes for the URL it is about to load"""
+        web_settings = page.settings()
+        if not web_settings:
+            return
+
+        # Remember the profile defaults so sites can go back to them
+        profile = page.profile()
+        profile_settings = profile.settings() if profile else None
+        if self.defaults is None and profile_settings:
+            self.defaults = {
+                name: profile_settings.testAttribute(attribute) != inverted
+                for name, (attribute, inverted) in SITE_ATTRIBUTES.items()
+            }
+
+        for name, on in self.settings_for(url).items():
+            attribute, inverted = SITE_ATTRIBUTES[name]
+            web_settings.setAttribute(attribute, on != inverted)
+
+    def toggle_lite_mode(self) -> bool:
+        self.lite_mode = not self.lite_mode
+        self.logger.info(f"Lite mode {'on' if self.lite_mode else 'off'}")
+        return self.lite_mode
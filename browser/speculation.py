@@ -0,0 +1,249 @@
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable
+
+from PyQt6.QtCore import QObject, QTimer, QUrl
+from PyQt6.QtWebEngineCore import QWebEngineProfile
+
+from browser.history import canonical_url, get_visit_counts
+from browser.qt import WebPage
+from browser.utils import Config, setup_logging, text_to_url
+
+
+def _strip_url(url: str) -> str:
+    """Drop the scheme and www. prefix so typed text can be prefix matched"""
+    return url.split("://", 1)[-1].removeprefix("www.").lower()
+
+
+def same_url(a: QUrl, b: QUrl) -> bool:
+    """Whether two URLs are equal but for a trailing slash"""
+
+    def strip(url: QUrl) -> QUrl:
+        url = url.adjusted(QUrl.UrlFormattingOption.StripTrailingSlash)
+        if url.path() == "/":
+            url.setPath("")
+        return url
+
+    return strip(a) == strip(b)
+
+
+def predict_url(
+    text: str, visit_counts: dict[str, int], search_engine: str
+) -> tuple[QUrl | None, float]:
+    """Guess where the address bar input leads and how confident we are"""
+    text = text.strip()
+    if not text or " " in text:
+        return None, 0.0
+
+    best_url: QUrl | None = None
+    confidence = 0.0
+
+    # Typed URLs: full URLs are a safer bet than bare hostnames
+    url = text_to_url(text, search_engine)
+    if url.scheme() in ("http", "https") and "." in url.host():
+        best_url = url
+        tld = url.host().rsplit(".", 1)[-1]
+        confidence = 0.8 if "://" in text else (0.6 if len(tld) >= 2 else 0.3)
+
+    # History matches: the more a single URL dominates, the more confident
+    prefix = _strip_url(text)
+    matches = {
+        url: visits
+        for url, visits in visit_counts.items()
+        if _strip_url(url).startswith(prefix)
+    }
+    if matches:
+        history_url = max(matches, key=lambda url: matches[url])
+        # Smooth by one visit so a single visit is never a sure thing
+        history_confidence = matches[history_url] / (sum(matches.values()) + 1)
+        if history_confidence > confidence:
+            best_url = QUrl(history_url)
+            confidence = history_confidence
+
+    return best_url, confidence
+
+
+@dataclass
+class SpeculationStats:
+    preconnects: int = 0
+    prerenders: int = 0
+    hits: int = 0
+    misses: int = 0
+    time_saved_ms: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class Speculator(QObject):
+    """Warms up or preloads the page the address bar input is heading to"""
+
+    def __init__(
+        self, profile: QWebEngineProfile | None = None, parent: QObject | None = None
+    ) -> None:
+        super().__init__(parent)
+        self.config = Config.load()
+        self.logger = setup_logging()
+        self.profile = profile or QWebEngineProfile.defaultProfile()
+        self.stats = SpeculationStats()
+
+        # Called on prerender pages before they load, e.g. for site settings
+        self.prepare_page: Callable[[WebPage, QUrl], None] | None = None
+
+        self._text = ""
+        self._visit_counts: dict[str, int] | None = None
+        self._preconnected: str | None = None
+        self._preconnect_page: WebPage | None = None
+
+        self._prerender_page: WebPage | None = None
+        self._prerender_url: QUrl | None = None
+        self._prerender_started = 0.0
+        self._prerender_finished: float | None = None
+
+        # Wait for a short typing pause before predicting
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(150)
+        self._timer.timeout.connect(self._speculate)
+
+    def update(self, text: str) -> None:
+        """Handle address bar edits, speculating again after a typing pause"""
+        # A prerender still matching the new text is kept, see _speculate
+        self._timer.stop()
+        self._text = text
+        if self.config.speculative_loading:
+            self._timer.start()
+        else:
+            self.cancel()
+
+    def cancel(self) -> None:
+        """Abort the current prerender, if any"""
+        self._timer.stop()
+        if self._prerender_page:
+            self.stats.misses += 1
+            url = self._prerender_url.toString() if self._prerender_url else ""
+            self.logger.info(
+                f"Speculation: discarded prerender of {url}"
+                f" (hit rate {self.stats.hit_rate:.0%})"
+            )
+            self._prerender_page.triggerAction(WebPage.WebAction.Stop)
+            self._prerender_page.deleteLater()
+        self._prerender_page = None
+        self._prerender_url = None
+
+    def trim(self) -> None:
+        """Drop the cached history visit counts"""
+        self._visit_counts = None
+
+    def record_visit(self, url: QUrl) -> None:
+        """Count a visit just added to the history, without re-reading it"""
+        if self._visit_counts is None:
+            return
+        canonical = canonical_url(url.url())
+        self._visit_counts[canonical] = self._visit_counts.get(canonical, 0) + 1
+
+    def take(self, url: QUrl) -> tuple[WebPage, bool] | None:
+        """Hand over the prerendered page and whether it finished loading"""
+        self._timer.stop()
+
+        page = self._prerender_page
+        if (
+            not page
+            or not self._prerender_url
+            or not same_url(self._prerender_url, url)
+        ):
+            self.cancel()
+            return None
+
+        loaded = self._prerender_finished is not None
+        finished = self._prerender_finished or perf_counter()
+        saved_ms = (finished - self._prerender_started) * 1000
+        self.stats.hits += 1
+        self.stats.time_saved_ms += saved_ms
+        self.logger.info(
+            f"Speculation: prerender hit for {url.toString()}, {saved_ms:.0f} ms saved"
+            f" (hit rate {self.stats.hit_rate:.0%},"
+            f" {self.stats.time_saved_ms:.0f} ms saved in total)"
+        )
+
+        # The page now belongs to the tab it is swapped into
+        page.loadFinished.disconnect()
+        self._prerender_page = None
+        self._prerender_url = None
+        return page, loaded
+
+    def _speculate(self) -> None:
+        if self._visit_counts is None:
+            try:
+                self._visit_counts = get_visit_counts()
+            except Exception as e:
+                self.logger.warning(f"[WARN] Speculation could not read history: {e}")
+                self._visit_counts = {}
+
+        search_engine = str(self.config.search_engine)
+        url, confidence = predict_url(self._text, self._visit_counts, search_engine)
+        # Enter loads what the text itself resolves to, there is no completion,
+        # so a prerender of any other URL could never be used
+        prerender = (
+            url is not None
+            and confidence >= self.config.prerender_confidence
+            and same_url(url, text_to_url(self._text.strip(), search_engine))
+        )
+        if prerender and url and self._prerender_url:
+            if same_url(url, self._prerender_url):
+                # Still loading, or loaded, since an earlier keystroke
+                return
+        self.cancel()
+        if not url:
+            return
+
+        if prerender:
+            self._prerender(url, confidence)
+        elif confidence >= self.config.preconnect_confidence:
+            self._preconnect(url, confidence)
+
+    def _preconnect(self, url: QUrl, confidence: float) -> None:
+        origin = url.adjusted(
+            QUrl.UrlFormattingOption.RemovePath | QUrl.UrlFormattingOption.RemoveQuery
+        ).toString()
+        if origin == self._preconnected:
+            return
+
+        # Chromium only warms up connections on behalf of a page
+        if not self._preconnect_page:
+            self._preconnect_page = WebPage(self.profile, self)
+        self._preconnect_page.setHtml(
+            f'<link rel="dns-prefetch" href="{origin}">'
+            f'<link rel="preconnect" href="{origin}">'
+        )
+        self._preconnected = origin
+        self.stats.preconnects += 1
+        self.logger.info(f"Speculation: preconnect to {origin} ({confidence:.2f})")
+
+    def _prerender(self, url: QUrl, confidence: float) -> None:
+        page = WebPage(self.profile, self)
+        page.loadFinished.connect(lambda ok: self._on_prerender_finished(page, ok))
+
+        self._prerender_page = page
+        self._prerender_url = url
+        self._prerender_started = perf_counter()
+        self._prerender_finished = None
+        if self.prepare_page:
+            self.prepare_page(page, url)
+        page.load(url)
+
+        self.stats.prerenders += 1
+        self.logger.info(
+            f"Speculation: prerender of {url.toString()} ({confidence:.2f})"
+        )
+
+    def _on_prerender_finished(self, page: WebPage, ok: bool) -> None:
+        if page is not self._prerender_page:
+            return
+        if ok:
+            self._prerender_finished = perf_counter()
+        else:
+            # Let Enter do a regular navigation that shows the error page
+            self.cancel()
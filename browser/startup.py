@@ -0,0 +1,105 @@
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator
+
+# Kept free of third-party imports so it can time them
+
+
+class StartupTracer:
+    """Records a timeline of the phases of a browser startup"""
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.events: list[dict[str, Any]] = []
+        self.current_phase = "startup"
+        self.finished = False
+        self._depth = 0
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.origin) * 1000
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the body of the with block as a named phase"""
+        parent_phase = self.current_phase
+        start = self.elapsed_ms()
+        self.current_phase = name
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.current_phase = parent_phase
+            if not self.finished:
+                self.events.append(
+                    {
+                        "phase": name,
+                        "start_ms": round(start, 2),
+                        "duration_ms": round(self.elapsed_ms() - start, 2),
+                        "depth": self._depth,
+                    }
+                )
+
+    def mark(self, name: str) -> None:
+        """Record a point in time, e.g. the first finished page load"""
+        if not self.finished:
+            self.events.append(
+                {
+                    "phase": name,
+                    "start_ms": round(self.elapsed_ms(), 2),
+                    "duration_ms": 0.0,
+                    "depth": self._depth,
+                }
+            )
+
+    def finish(self) -> bool:
+        """Close the timeline, returns False if it was already closed"""
+        if self.finished:
+            return False
+        self.mark("startup finished")
+        self.finished = True
+        self.current_phase = "running"
+        return True
+
+    def timeline(self) -> list[dict[str, Any]]:
+        # Phases are recorded when they end, so nested ones come first
+        return sorted(
+            self.events, key=lambda event: (event["start_ms"], event["depth"])
+        )
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "date": datetime.now().isoformat(),
+            "total_ms": max(
+                (event["start_ms"] + event["duration_ms"] for event in self.events),
+                default=0.0,
+            ),
+            "phases": self.timeline(),
+        }
+
+    def format(self) -> str:
+        lines = [f"{'phase':<40} {'start':>10} {'duration':>10}"]
+        for event in self.timeline():
+            name = "  " * event["depth"] + event["phase"]
+            lines.append(
+                f"{name:<40} {event['start_ms']:>8.1f}ms {event['duration_ms']:>8.1f}ms"
+            )
+        return "\n".join(lines)
+
+    def write(self) -> Path:
+        """Write the timeline to data/logs/startup.json"""
+        root_dir = Path(__file__).parent.parent
+        log_dir = root_dir / "data" / "logs"
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+        startup_file = log_dir / "startup.json"
+        with open(startup_file, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+        return startup_file
+
+
+tracer = StartupTracer()
@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Generic, TypeVar
+from urllib.parse import urlsplit
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QKeyEvent
+from PyQt6.QtWidgets import (
+    QDialog,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from browser.qt import WebView
+
+if TYPE_CHECKING:
+    from browser.tabs import Tabs
+
+K = TypeVar("K")
+
+
+@dataclass
+class TabEntry:
+    title: str = ""
+    url: str = ""
+    domain: str = ""
+    # Lowercased title, domain and URL, matched against queries
+    haystack: str = ""
+    # Lowercased title and domain, URLs are too long for fuzzy matches
+    fuzzy_haystack: str = ""
+
+    def reindex(self) -> None:
+        self.domain = (urlsplit(self.url).hostname or "").removeprefix("www.")
+        self.fuzzy_haystack = f"{self.title}\n{self.domain}".lower()
+        self.haystack = f"{self.fuzzy_haystack}\n{self.url.lower()}"
+
+
+def is_subsequence(term: str, text: str) -> bool:
+    """Letters of term in order with anything in between, e.g. "gml" -> gmail"""
+    # Each letter is searched for after the previous one, a single pass
+    remaining = iter(text)
+    return all(letter in remaining for letter in term)
+
+
+class TabIndex(Generic[K]):
+    """Searchable titles, URLs and domains of open tabs, updated per change"""
+
+    def __init__(self) -> None:
+        self.entries: dict[K, TabEntry] = {}
+
+    def update(self, key: K, title: str | None = None, url: str | None = None) -> None:
+        entry = self.entries.setdefault(key, TabEntry())
+        if title is not None:
+            entry.title = title
+        if url is not None:
+            entry.url = url
+        entry.reindex()
+
+    def remove(self, key: K) -> None:
+        self.entries.pop(key, None)
+
+    @staticmethod
+    def _score(entry: TabEntry, term: str) -> int:
+        if entry.domain.startswith(term):
+            return 4
+        title = entry.title.lower()
+        if title.startswith(term) or f" {term}" in title:
+            return 3
+        if term in entry.haystack:
+            return 2
+        if is_subsequence(term, entry.fuzzy_haystack):
+            return 1
+        return 0
+
+    def search(self, query: str, limit: int = 50) -> list[K]:
+        """Tabs matching every word of the query, best matches first"""
+        terms = query.lower().split()
+        if not terms:
+            return list(self.entries)[:limit]
+
+        scored: list[tuple[int, int, K]] = []
+        for order, (key, entry) in enumerate(self.entries.items()):
+            total = 0
+            for term in terms:
+                score = self._score(entry, term)
+                if not score:
+                    break
+                total += score
+            else:
+                scored.append((-total, order, key))
+
+        scored.sort(key=lambda item: item[:2])
+        return [key for _, _, key in scored[:limit]]
+
+
+class TabSwitcher(QDialog):
+    """Search palette for jumping to any open tab"""
+
+    def __init__(self, tabs: "Tabs", parent: QWidget | None = None) -> None:
+        super().__init__(parent)
+        self.tabs = tabs
+        self.setWindowTitle("Switch to tab")
+        self.resize(600, 400)
+
+        self.search_bar = QLineEdit()
+        self.search_bar.setPlaceholderText("Search tabs by title, domain or URL")
+        self.search_bar.textChanged.connect(self.update_results)
+        self.search_bar.returnPressed.connect(self.activate_current)
+
+        self.results = QListWidget()
+        self.results.itemActivated.connect(self.activate_item)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.search_bar)
+        layout.addWidget(self.results)
+
+    def popup(self) -> None:
+        self.search_bar.clear()
+        self.update_results("")
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.search_bar.setFocus()
+
+    def update_results(self, query: str) -> None:
+        self.results.clear()
+        for web_view in self.tabs.index.search(query):
+            entry = self.tabs.index.entries[web_view]
+            label = entry.title or entry.url or "New Tab"
+            if entry.domain:
+                label += f"  —  {entry.domain}"
+            item = QListWidgetItem(label)
+            item.setData(Qt.ItemDataRole.UserRole, web_view)
+            self.results.addItem(item)
+        self.results.setCurrentRow(0)
+
+    def activate_current(self) -> None:
+        item = self.results.currentItem()
+        if item:
+            self.activate_item(item)
+
+    def activate_item(self, item: QListWidgetItem) -> None:
+        web_view = item.data(Qt.ItemDataRole.UserRole)
+        if isinstance(web_view, WebView):
+            # Discarded tabs come back to life when they become current
+            index = self.tabs.indexOf(web_view)
+            if index != -1:
+                self.tabs.setCurrentIndex(index)
+        self.hide()
+
+    def keyPressEvent(self, a0: QKeyEvent | None) -> None:
+        # Arrow keys move through the results while typing
+        if a0 and a0.key() in (Qt.Key.Key_Up, Qt.Key.Key_Down):
+            step = -1 if a0.key() == Qt.Key.Key_Up else 1
+            row = self.results.currentRow() + step
+            if 0 <= row < self.results.count():
+                self.results.setCurrentRow(row)
+            return
+        super().keyPressEvent(a0)
@@ -1,8 +1,13 @@
-from PyQt6.QtCore import QUrl, pyqtSignal
+from time import monotonic
+
+from PyQt6.QtCore import QByteArray, QUrl, pyqtSignal
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QTabWidget, QWidget
+from browser.closed_tabs import ClosedTab, ClosedTabs, restore_history
 from browser.history import append_to_favicons, append_to_history
 from browser.qt import ToolButton, WebPage, WebView
+from browser.site_settings import SiteSettings
+from browser.tab_search import TabIndex
 from browser.utils import Config, setup_logging
 
 
@@ -15,11 +20,37 @@ class Tabs(QTabWidget):
     # Signal emitted when window's last tab is closed
     last_tab_closed = pyqtSignal()
 
-    def __init__(self, parent: QWidget | None = None) -> None:
+    # Signal emitted when a page load is added to the history
+    page_visited = pyqtSignal(QUrl)
+
+    def __init__(
+        self,
+        parent: QWidget | None = None,
+        initial_url: str | None = None,
+        record_history: bool = True,
+    ) -> None:
         super().__init__(parent)
         self.config = Config.load()
         self.logger = setup_logging()
 
+        # Off for benchmark and batch loads, kept out of the user's history
+        self.record_history = record_history
+
+        # When each tab was last active, for discarding the least recent first
+        self.last_activated: dict[WebView, float] = {}
+
+        # URL and title of discarded tabs, restored when they are activated
+        self.discarded: dict[WebView, tuple[QUrl, str]] = {}
+
+        # Recently closed tabs, reopened newest first
+        self.closed_tabs = ClosedTabs()
+
+        # Titles, URLs and domains of every tab, for the tab switcher
+        self.index: TabIndex[WebView] = TabIndex()
+
+        # Per-site JavaScript/images/autoplay/plugins settings and lite mode
+        self.site_settings = SiteSettings()
+
         # Configure tab widget
         self.setTabsClosable(True)
         self.setMovable(True)
@@ -31,23 +62,36 @@ class Tabs(QTabWidget):
         self.tabBarDoubleClicked.connect(self._tab_open_doubleclick)
 
         # Create initial tab
-        self.create_new_tab()
+        self.create_new_tab(initial_url)
 
-    def create_new_tab(self, url: str | None = None) -> WebView:
-        """Create a new tab with a web view"""
+    def create_new_tab(
+        self, url: str | None = None, history: QByteArray | None = None
+    ) -> WebView:
+        """Create a new tab with a web view, optionally restoring its history"""
         web_view = WebView()
+        # Site settings follow every navigation, not just typed ones
+        page = WebPage(web_view)
+        page.before_navigation = self.site_settings.apply
+        web_view.setPage(page)
+        self.index.update(web_view, url=url or self.config.homepage)
 
         # Set URL or homepage
-        if url:
-            web_view.setUrl(QUrl(url))
-        else:
-            web_view.setUrl(QUrl(self.config.homepage))
+        if history:
+            self.site_settings.apply(page, QUrl(url))
+        if not history or not restore_history(page, history):
+            self.load_url(web_view, QUrl(url or self.config.homepage))
 
         # Connect signals
         web_view.titleChanged.connect(
             lambda title: self._update_tab_title(web_view, title)
         )
         web_view.urlChanged.connect(self._on_url_changed)
+        web_view.titleChanged.connect(
+            lambda title: self._update_index(web_view, title=title)
+        )
+        web_view.urlChanged.connect(
+            lambda url: self._update_index(web_view, url=url.toString())
+        )
         web_view.loadStarted.connect(
             lambda: self._update_tab_title(web_view, "Loading...")
         )
@@ -55,6 +99,7 @@ class Tabs(QTabWidget):
         web_view.iconChanged.connect(lambda icon: self._update_tab_icon(web_view, icon))
 
         # Add tab
+        self.last_activated[web_view] = monotonic()
         tab_index = self.addTab(web_view, "New Tab")
         self.setCurrentIndex(tab_index)
 
@@ -74,7 +119,7 @@ class Tabs(QTabWidget):
             if not self.config.close_after_last_tab:
                 web_view = self.widget(index)
                 if isinstance(web_view, WebView):
-                    web_view.setUrl(QUrl(self.config.homepage))
+                    self.load_url(web_view, QUrl(self.config.homepage))
                 return
             else:
                 # Clean up and emit signal
@@ -97,14 +142,99 @@ class Tabs(QTabWidget):
         widget = self.widget(index)
         if widget:
             if isinstance(widget, WebView):
+                self.last_activated.pop(widget, None)
+                discarded = self.discarded.pop(widget, None)
+                self.index.remove(widget)
                 page = widget.page()
                 if not page:
                     return
-                page.deleteLater()
+
+                closed = ClosedTab(
+                    url=widget.url(), title=page.title(), icon=page.icon(), index=index
+                )
+                self.removeTab(index)
+                if discarded:
+                    # Nothing left to freeze, reopens from its URL
+                    closed.url, closed.title = discarded
+                    page.deleteLater()
+                    widget.deleteLater()
+                else:
+                    # Kept whole, it is frozen and deleted once it ages out
+                    closed.view = widget
+                self.closed_tabs.push(closed, self.views())
+                return
 
             self.removeTab(index)
             widget.deleteLater()
 
+    def reopen_closed_tab(self) -> WebView | None:
+        """Reopen the most recently closed tab where it was"""
+        closed = self.closed_tabs.pop()
+        if not closed:
+            return None
+        if not closed.view:
+            web_view = self.create_new_tab(closed.url.toString(), closed.history)
+            tab_bar = self.tabBar()
+            if tab_bar:
+                tab_bar.moveTab(
+                    self.indexOf(web_view), min(closed.index, self.count() - 1)
+                )
+            return web_view
+
+        # Still frozen with its scroll position and form state, no reload
+        web_view = closed.view
+        self.last_activated[web_view] = monotonic()
+        self.index.update(web_view, title=closed.title, url=closed.url.toString())
+        tab_index = self.insertTab(min(closed.index, self.count()), web_view, "New Tab")
+        self._update_tab_title(web_view, closed.title)
+        self.setTabIcon(tab_index, closed.icon)
+        self.setCurrentIndex(tab_index)
+        return web_view
+
+    def views(self) -> list[WebView]:
+        """Web views of the open tabs, in tab order"""
+        return [
+            view
+            for view in (self.widget(i) for i in range(self.count()))
+            if isinstance(view, WebView)
+        ]
+
+    def adopt_page(self, web_view: WebView, page: WebPage, loaded: bool) -> None:
+        """Swap a page loaded elsewhere (e.g. a prerender) into a tab"""
+        # The view deletes its old page when that page is its child
+        page.setParent(web_view)
+        page.before_navigation = self.site_settings.apply
+        web_view.setPage(page)
+
+        self._update_tab_title(web_view, page.title())
+        self._update_tab_icon(web_view, page.icon())
+        self.index.update(web_view, title=page.title(), url=page.url().toString())
+        if web_view == self.get_current_web_view():
+            self.current_url_changed.emit(page.url())
+
+        # Its loadFinished fired before we were listening
+        if loaded and self.record_history:
+            append_to_history(page)
+            self.page_visited.emit(page.url())
+
+    def background_tabs_by_lru(self) -> list[WebView]:
+        """Live tabs other than the current one, least recently used first"""
+        current_view = self.get_current_web_view()
+        views = [
+            view
+            for view in self.last_activated
+            if view != current_view and view not in self.discarded
+        ]
+        return sorted(views, key=lambda view: self.last_activated[view])
+
+    def discard_tab(self, web_view: WebView) -> None:
+        """Free a background tab's renderer, it reloads when activated again"""
+        page = web_view.page()
+        if not page or web_view == self.get_current_web_view():
+            return
+        self.discarded[web_view] = (web_view.url(), page.title())
+        page.setLifecycleState(WebPage.LifecycleState.Discarded)
+
     def get_current_web_view(self) -> WebView | None:
         """Get the current active web view"""
         current_widget = self.currentWidget()
@@ -116,7 +246,23 @@ class Tabs(QTabWidget):
         """Navigate the current tab to a URL"""
         web_view = self.get_current_web_view()
         if web_view:
-            web_view.setUrl(QUrl(url))
+            self.load_url(web_view, QUrl(url))
+
+    def load_url(self, web_view: WebView, url: QUrl) -> None:
+        """Navigate a tab, applying the target site's settings first"""
+        page = web_view.page()
+        if page:
+            self.site_settings.apply(page, url)
+        web_view.setUrl(url)
+
+    def apply_site_settings(self) -> None:
+        """Re-apply site settings to every tab, e.g. after toggling lite mode"""
+        for i in range(self.count()):
+            web_view = self.widget(i)
+            if isinstance(web_view, WebView):
+                page = web_view.page()
+                if page:
+                    self.site_settings.apply(page, web_view.url())
 
     def _update_tab_title(self, web_view: WebView, title: str) -> None:
         """Update the title of a tab"""
@@ -127,6 +273,14 @@ class Tabs(QTabWidget):
                 self.setTabText(i, display_title or "Untitled")
                 break
 
+    def _update_index(
+        self, web_view: WebView, title: str | None = None, url: str | None = None
+    ) -> None:
+        """Index a tab's new title or URL, unless it was closed since"""
+        # Closed tabs stay alive while frozen and may still change
+        if self.indexOf(web_view) != -1:
+            self.index.update(web_view, title=title, url=url)
+
     def _update_tab_icon(self, web_view: WebView, icon: QIcon) -> None:
         """Update the favicon of a tab"""
         for i in range(self.count()):
@@ -134,16 +288,31 @@ class Tabs(QTabWidget):
                 self.setTabIcon(i, icon)
                 break
         page = web_view.page()
-        if page:
+        if page and self.record_history:
             append_to_favicons(page, icon)
 
     def _on_tab_changed(self, index: int) -> None:
         """Handle tab change"""
         web_view = self.widget(index)
         if isinstance(web_view, WebView):
+            self.last_activated[web_view] = monotonic()
+            if web_view in self.discarded:
+                self._restore_discarded(web_view)
+
             # Emit URL change signal
             self.current_url_changed.emit(web_view.url())
 
+    def _restore_discarded(self, web_view: WebView) -> None:
+        url, title = self.discarded.pop(web_view)
+        page = web_view.page()
+        if not page:
+            return
+        # Visible pages become active on their own, this just makes it explicit
+        page.setLifecycleState(WebPage.LifecycleState.Active)
+        if web_view.url().isEmpty():
+            web_view.setUrl(url)
+        self._update_tab_title(web_view, title)
+
     def _on_url_changed(self, url: QUrl) -> None:
         """Handle URL change in current tab"""
         sender_view = self.sender()
@@ -169,7 +338,9 @@ class Tabs(QTabWidget):
         if not page:
             return
         self._update_tab_title(view, page.title())
-        append_to_history(page)
+        if self.record_history:
+            append_to_history(page)
+            self.page_visited.emit(page.url())
 
     def request_dev_tools(self):
         tab = self.get_current_web_view()  # Get your current web view
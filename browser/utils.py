@@ -1,17 +1,85 @@
+import atexit
 from bisect import bisect_left
+import gzip
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import json
+import os
+import queue
+import shutil
 from functools import cache
+import types
 from pathlib import Path
 import subprocess
 import sys
-from typing import Any, Callable, List, Literal
-from dataclasses import asdict, dataclass, field
-
-from PyQt6.QtCore import pyqtBoundSignal
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Iterable,
+    List,
+    Literal,
+    TypeVar,
+    Union,
+    cast,
+    get_args,
+    get_origin,
+)
+from dataclasses import asdict, dataclass, field, fields
+
+from PyQt6.QtCore import (
+    QFileSystemWatcher,
+    QObject,
+    QTimer,
+    QUrl,
+    pyqtBoundSignal,
+    pyqtSignal,
+)
 from PyQt6.QtGui import QAction, QFont, QFontDatabase, QKeySequence, QShortcut
 from PyQt6.QtWidgets import QWidget
 
+from browser.startup import tracer
+
+
+def matches_type(value: Any, annotation: Any) -> bool:
+    """Whether a value read from JSON fits a dataclass field's annotation"""
+    origin = get_origin(annotation)
+    if origin is Literal:
+        return value in get_args(annotation)
+    if origin in (Union, types.UnionType):
+        return any(matches_type(value, arg) for arg in get_args(annotation))
+    if origin is list:
+        (item,) = get_args(annotation) or (Any,)
+        return isinstance(value, list) and all(matches_type(v, item) for v in value)
+    if annotation is Any:
+        return True
+    # JSON has no separate booleans and integers for isinstance, tell them apart
+    if annotation is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if annotation is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, annotation)
+
+
+def reload_fields(current: Any, fresh: Any, name: str) -> dict[str, tuple[Any, Any]]:
+    """Copy changed fields of fresh into current, skipping mistyped values"""
+    changes: dict[str, tuple[Any, Any]] = {}
+    for data_field in fields(current):
+        old = getattr(current, data_field.name)
+        new = getattr(fresh, data_field.name)
+        if old == new:
+            continue
+        if not matches_type(new, data_field.type):
+            setup_logging().warning(
+                f"[WARN] Ignoring {name} {data_field.name}={new!r},"
+                f" expected {getattr(data_field.type, '__name__', data_field.type)}"
+            )
+            continue
+        changes[data_field.name] = (old, new)
+        # Updated in place, so everyone holding it sees the change
+        setattr(current, data_field.name, new)
+    return changes
+
 
 @dataclass
 class Config:
@@ -19,13 +87,49 @@ class Config:
     homepage: str = "https://google.com"
     search_engine: str = "https://google.com/search?q=%s"
     stdout_log: bool = True
+    log_level: str = "INFO"
+    log_format: Literal["text", "json"] = "text"
+    log_max_bytes: int = 5 * 1024 * 1024
+    log_backups: int = 5
     icon_theme: Literal["automatic", "system"] | str = "automatic"
     close_after_last_tab: bool = False
     zoom_level: int = 100
+    # Off by default, prerendering sends requests the user never asked for
+    speculative_loading: bool = False
+    preconnect_confidence: float = 0.5
+    prerender_confidence: float = 0.85
+    memory_budget_mb: int = 0
+    memory_min_free_percent: float = 0
+    memory_check_interval: int = 15
+    download_directory: str = ""
+    segmented_downloads: bool = True
+    segmented_download_min_mb: int = 16
+    download_segments: int = 4
+    download_bandwidth_kbps: int = 0
+    lite_mode: bool = False
+    slow_handler_threshold_ms: int = 0
+    adblock_host_prefilter: bool = False
+    # Diagnostics only, records which rules match, at the cost of a debug
+    # engine that takes more memory and longer to build
+    adblock_hit_tracking: bool = False
+    # Opt-in, builds only from tracked rules, so needs adblock_hit_tracking
+    # and misses blocks of rules not matched lately until a full rebuild
+    adblock_compact_engine: bool = False
+    adblock_compact_days: int = 30
+    adblock_full_rebuild_days: int = 7
+    closed_tabs_frozen: int = 3
+    closed_tabs_max: int = 25
+    closed_tabs_memory_mb: int = 256
+    single_instance: bool = True
 
     @classmethod
     @cache
     def load(cls):
+        return cls.read(save=True)
+
+    @classmethod
+    def read(cls, save: bool = False):
+        """Read data/config.json, saving it back with any new settings added"""
         root_dir = Path(__file__).parent.parent
         data_dir = root_dir / "data"
         data_dir.mkdir(parents=True, exist_ok=True)
@@ -38,20 +142,22 @@ class Config:
         else:
             config = cls()
 
-        with open(config_file, "w") as f:
-            json.dump(asdict(config), f, indent=2)
+        if save:
+            with open(config_file, "w") as f:
+                json.dump(asdict(config), f, indent=2)
 
         return config
 
     @classmethod
-    def reload(cls):
-        cls.load.cache_clear()
-        return cls.load()
+    def reload(cls) -> dict[str, tuple[Any, Any]]:
+        """Re-read the file into the loaded config, returns what changed"""
+        return reload_fields(cls.load(), cls.read(), "config setting")
 
 
 KeybindingsType = Literal[
     "new_tab",
     "close_tab",
+    "reopen_tab",
     "next_tab",
     "prev_tab",
     "prev_page",
@@ -68,7 +174,13 @@ KeybindingsType = Literal[
     "increase_zoom",
     "decrease_zoom",
     "open_config",
-    # TODO: find a way to make this work: "reload_config",
+    "downloads",
+    "lite_mode",
+    "tab_search",
+    "toggle_adblock",
+    "toggle_profiler",
+    "memory_snapshot",
+    "reload_config",
 ]
 
 
@@ -76,6 +188,7 @@ KeybindingsType = Literal[
 class Keybindings:
     new_tab: list[str] = field(default_factory=lambda: ["Ctrl+T"])
     close_tab: list[str] = field(default_factory=lambda: ["Ctrl+W"])
+    reopen_tab: list[str] = field(default_factory=lambda: ["Ctrl+Shift+T"])
     next_tab: list[str] = field(default_factory=lambda: ["Ctrl+Tab"])
     prev_tab: list[str] = field(default_factory=lambda: ["Ctrl+Shift+Tab"])
     prev_page: list[str] = field(default_factory=lambda: ["Alt+Left", "Alt+Backspace"])
@@ -94,11 +207,26 @@ class Keybindings:
     increase_zoom: list[str] = field(default_factory=lambda: ["Ctrl+="])
     decrease_zoom: list[str] = field(default_factory=lambda: ["Ctrl+-"])
     open_config: list[str] = field(default_factory=lambda: ["Ctrl+,"])
+    downloads: list[str] = field(default_factory=lambda: ["Ctrl+J"])
+    lite_mode: list[str] = field(default_factory=lambda: ["Ctrl+Shift+L"])
+    tab_search: list[str] = field(default_factory=lambda: ["Ctrl+Shift+A"])
+    toggle_adblock: list[str] = field(default_factory=lambda: ["Ctrl+Shift+B"])
+    toggle_profiler: list[str] = field(default_factory=lambda: ["Ctrl+Alt+P"])
+    memory_snapshot: list[str] = field(default_factory=lambda: ["Ctrl+Alt+M"])
     reload_config: list[str] = field(default_factory=lambda: ["Ctrl+Shift+,"])
 
+    def __post_init__(self) -> None:
+        # Bound shortcuts per name, so they can be rebound when keys change
+        self._bound: dict[str, list[tuple[Any, QWidget | None, list[QShortcut]]]] = {}
+
     @classmethod
     @cache
     def load(cls):
+        return cls.read(save=True)
+
+    @classmethod
+    def read(cls, save: bool = False):
+        """Read data/keybinds.json, saving it back with any new bindings added"""
         root_dir = Path(__file__).parent.parent
         data_dir = root_dir / "data"
         data_dir.mkdir(parents=True, exist_ok=True)
@@ -111,15 +239,20 @@ class Keybindings:
         else:
             keybinds = cls()
 
-        with open(keybinds_file, "w") as f:
-            json.dump(asdict(keybinds), f, indent=2)
+        if save:
+            with open(keybinds_file, "w") as f:
+                json.dump(asdict(keybinds), f, indent=2)
 
         return keybinds
 
     @classmethod
-    def reload(cls):
-        cls.load.cache_clear()
-        return cls.load()
+    def reload(cls) -> list[str]:
+        """Re-read the file and rebind the shortcuts that changed"""
+        keybinds = cls.load()
+        changed = list(reload_fields(keybinds, cls.read(), "keybinding"))
+        for name in changed:
+            keybinds.rebind(name)
+        return changed
 
     def sequences(self, name: KeybindingsType) -> list[QKeySequence]:
         sequences: list[QKeySequence] = []
@@ -133,21 +266,67 @@ class Keybindings:
         name: KeybindingsType,
         action: Callable[..., Any] | pyqtBoundSignal | QAction | None = lambda: None,
         parent: QWidget | None = None,
-    ) -> None:
+    ) -> list[QShortcut]:
+        shortcuts: list[QShortcut] = []
         sequences = self.sequences(name)
         for sequence in sequences:
             shortcut = QShortcut(sequence, parent)
+            shortcuts.append(shortcut)
             if not action:
-                return
+                continue
             elif isinstance(action, QAction):
                 shortcut.activated.connect(action.trigger)
             else:
                 shortcut.activated.connect(action)
+        self._bound.setdefault(name, []).append((action, parent, shortcuts))
+        return shortcuts
+
+    def rebind(self, name: KeybindingsType | str) -> None:
+        """Replace the shortcuts bound for name with ones for its current keys"""
+        for action, parent, shortcuts in self._bound.pop(name, []):
+            for shortcut in shortcuts:
+                shortcut.setEnabled(False)
+                shortcut.deleteLater()
+            self.bind_shortcuts(cast(KeybindingsType, name), action, parent)
+
+
+class PhaseFilter(logging.Filter):
+    """Tag log records with the startup phase they were emitted in"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.phase = tracer.current_phase
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as JSON lines"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {
+                "time": self.formatTime(record, self.datefmt),
+                "level": record.levelname,
+                "message": record.getMessage(),
+                "thread": record.threadName,
+                "phase": getattr(record, "phase", None),
+            }
+        )
+
+
+def _compress_rotated_log(source: str, dest: str) -> None:
+    """Gzip a rotated log file, runs on the log listener thread"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+_log_listener: QueueListener | None = None
 
 
 @cache
 def setup_logging():
     """Configure logging system"""
+    global _log_listener
     config = Config.load()
 
     root_dir = Path(__file__).parent.parent
@@ -158,18 +337,88 @@ def setup_logging():
 
     log_file = log_dir / "veil_browser.log"
 
-    handlers: list[logging.Handler] = [logging.FileHandler(log_file, encoding="utf-8")]
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=config.log_max_bytes,
+        backupCount=config.log_backups,
+        encoding="utf-8",
+    )
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.rotator = _compress_rotated_log
+
+    handlers: list[logging.Handler] = [file_handler]
 
     if config.stdout_log:
         handlers.append(logging.StreamHandler())
 
+    if config.log_format == "json":
+        formatter = JsonFormatter(datefmt="%Y-%m-%d %H:%M:%S")
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(levelname)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Callers only enqueue records, the listener thread does all the IO
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(PhaseFilter())
+    # Only merge args into the message, the listener's handlers do the rest
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    levels = logging.getLevelNamesMapping()
+    level_name = config.log_level.upper()
     logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        handlers=handlers,
+        level=levels.get(level_name, logging.INFO), handlers=[queue_handler]
     )
-    return logging.getLogger(__name__)
+
+    logger = logging.getLogger(__name__)
+    if level_name not in levels:
+        logger.warning(f"[WARN] Unknown log level {config.log_level}, using INFO")
+    return logger
+
+
+def update_logging(config: Config) -> None:
+    """Apply changed stdout_log and log_level settings to the running logger"""
+    if not _log_listener:
+        return
+
+    handlers = list(_log_listener.handlers)
+    stdout_handlers = [h for h in handlers if type(h) is logging.StreamHandler]
+    if config.stdout_log and not stdout_handlers:
+        stdout_handler = logging.StreamHandler()
+        stdout_handler.setFormatter(handlers[0].formatter)
+        handlers.append(stdout_handler)
+    elif not config.stdout_log:
+        handlers = [h for h in handlers if h not in stdout_handlers]
+    # Swapped in one go, the listener thread reads the tuple per record
+    _log_listener.handlers = tuple(handlers)
+
+    level = logging.getLevelNamesMapping().get(config.log_level.upper())
+    if level is None:
+        logging.getLogger(__name__).warning(
+            f"[WARN] Unknown log level {config.log_level}, keeping the current one"
+        )
+    else:
+        logging.getLogger().setLevel(level)
+
+
+def text_to_url(text: str, search_engine: str) -> QUrl:
+    """Turn address bar input into a URL, falling back to a search query"""
+    url = QUrl(text)
+
+    if not url.scheme():
+        if "." in text and " " not in text:
+            url = QUrl("https://" + text)
+        else:
+            url = QUrl(search_engine.replace("%s", text))
+
+    return url
 
 
 def open_in_default_editor(filepath: str | Path):
@@ -198,6 +447,41 @@ def get_icon_font():
     return font
 
 
+class WatchedFiles(QObject):
+    """Emits changed once the files settle after being saved, replaced or recreated"""
+
+    changed = pyqtSignal()
+
+    def __init__(
+        self, paths: list[Path], parent: QObject | None = None, delay_ms: int = 200
+    ) -> None:
+        super().__init__(parent)
+        self.files = [str(path) for path in paths]
+
+        # Editors often save by replacing the file, so debounce the events
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self.changed.emit)
+
+        # Directories too, to notice a deleted file coming back
+        directories = {str(path.parent) for path in paths}
+        self._watcher = QFileSystemWatcher([*self.files, *directories], self)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+
+    def _on_file_changed(self, path: str) -> None:
+        # A replaced file drops out of the watcher, so watch it again
+        if path not in self._watcher.files() and Path(path).exists():
+            self._watcher.addPath(path)
+        self._timer.start()
+
+    def _on_directory_changed(self, _path: str) -> None:
+        for path in self.files:
+            if path not in self._watcher.files() and Path(path).exists():
+                self._on_file_changed(path)
+
+
 class StepCycler:
     def __init__(self, steps: List[int], initial_value: int | None = None):
         self.steps = sorted(steps)
@@ -239,3 +523,51 @@ class StepCycler:
     def reset(self) -> int:
         self.current_index = self.initial_index
         return self.steps[self.current_index]
+
+
+T = TypeVar("T")
+
+
+class HostTrie(Generic[T]):
+    """Reverse-domain trie, matches a host against domains and their subdomains"""
+
+    _VALUE = ""  # Labels are never empty, so this key can't clash
+
+    def __init__(self, domains: dict[str, T] | None = None) -> None:
+        self.root: dict[str, Any] = {}
+        self.size = 0
+        for domain, value in (domains or {}).items():
+            self.add(domain, value)
+
+    @classmethod
+    def from_domains(cls, domains: Iterable[str]) -> "HostTrie[bool]":
+        return HostTrie({domain: True for domain in domains})
+
+    @staticmethod
+    def _labels(host: str) -> list[str]:
+        return host.lower().strip(".").split(".")[::-1]
+
+    def add(self, domain: str, value: T) -> None:
+        node = self.root
+        for label in self._labels(domain):
+            node = node.setdefault(label, {})
+        if self._VALUE not in node:
+            self.size += 1
+        node[self._VALUE] = value
+
+    def lookup(self, host: str) -> T | None:
+        """Value of the most specific domain the host belongs to"""
+        node = self.root
+        value = None
+        for label in self._labels(host):
+            node = node.get(label)
+            if node is None:
+                break
+            value = node.get(self._VALUE, value)
+        return value
+
+    def __contains__(self, host: str) -> bool:
+        return self.lookup(host) is not None
+
+    def __len__(self) -> int:
+        return self.size
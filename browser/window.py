@@ -12,33 +12,57 @@ from PyQt6.QtCore import QPoint, QUrl, Qt
 from PyQt6.QtGui import QIcon
 
 from browser.adblock import AdBlockInterceptor
+from browser.config_watcher import ConfigWatcher
+from browser.downloads import DownloadManager
+from browser.memory import MemoryGovernor
+from browser.profiling import Profiler, SlowHandlerWatchdog
+from browser.speculation import Speculator
+from browser.startup import tracer
 from browser.utils import (
     Config,
     Keybindings,
     StepCycler,
     open_in_default_editor,
     setup_logging,
+    text_to_url,
+    update_logging,
 )
 from browser.qt import ToolButton, WebAction, WebView
+from browser.tab_search import TabSwitcher
 from browser.tabs import Tabs
 
 import pyperclip
 
 logger = setup_logging()
 
+# Settings only read at startup, changing them needs a restart
+RESTART_SETTINGS = {
+    "log_format",
+    "log_max_bytes",
+    "log_backups",
+    "download_directory",
+    "adblock_host_prefilter",
+    "adblock_hit_tracking",
+    "adblock_compact_engine",
+    "adblock_compact_days",
+    "adblock_full_rebuild_days",
+    "single_instance",
+}
+
 
 class VeilBrowser(QMainWindow):
     """Main browser window class"""
 
-    def __init__(self):
+    def __init__(self, initial_url: str | None = None, record_history: bool = True):
         super().__init__()
         self.config = Config.load()
         self.init_window()
-        self.init_ui()
+        self.init_ui(initial_url, record_history)
 
     def init_window(self):
         self.setMouseTracking(True)
         self._drag_position: QPoint = QPoint()
+        self.is_dark = True
         self.resize(800, 600)
 
         instance = QApplication.instance()
@@ -55,8 +79,21 @@ class VeilBrowser(QMainWindow):
             logger.warning("[WARNING] Profile not found!")
             return
 
-        ad_blocker = AdBlockInterceptor()
-        self.profile.setUrlRequestInterceptor(ad_blocker)
+        with tracer.phase("adblock engine"):
+            self.ad_blocker = AdBlockInterceptor()
+        self.ad_blocker.install(self.profile)
+
+        # Downloads, big ones are fetched in parallel segments
+        self.downloads = DownloadManager(self.profile, self)
+        self.instance.aboutToQuit.connect(self.downloads.shutdown)
+
+        # Speculative preconnect/prerender while typing in the address bar
+        self.speculator = Speculator(self.profile, self)
+
+        # Debug hooks for finding what makes the UI stutter
+        self.profiler = Profiler()
+        self.watchdog: SlowHandlerWatchdog | None = None
+        self._configure_watchdog()
 
         zoom_levels = [
             25,
@@ -79,13 +116,30 @@ class VeilBrowser(QMainWindow):
         ]
         self.zoom_cycler = StepCycler(zoom_levels, initial_value=self.config.zoom_level)
 
-    def init_ui(self):
+        # Edits to config.json and keybinds.json apply without a restart
+        self.config_watcher = ConfigWatcher(self)
+        self.config_watcher.config_changed.connect(self.apply_config_changes)
+
+    def init_ui(self, initial_url: str | None = None, record_history: bool = True):
         main_widget = QWidget()
 
         # Tab widget with web views
-        self.tabs = Tabs()
+        with tracer.phase("tabs"):
+            self.tabs = Tabs(initial_url=initial_url, record_history=record_history)
         self.tabs.current_url_changed.connect(self.update_url)
         self.tabs.last_tab_closed.connect(self.close)
+        self.speculator.prepare_page = self.tabs.site_settings.apply
+        self.tabs.page_visited.connect(self.speculator.record_visit)
+        self.tab_switcher = TabSwitcher(self.tabs, self)
+
+        # Discard background tabs and trim caches under memory pressure
+        self.memory_governor = MemoryGovernor(self.tabs, self)
+        self.memory_governor.register_trimmer(
+            "history visit counts", self.speculator.trim
+        )
+        self.memory_governor.register_trimmer(
+            "frozen closed tabs", self.tabs.closed_tabs.release_frozen
+        )
 
         layout = QVBoxLayout(main_widget)
         layout.setContentsMargins(1, 1, 1, 1)
@@ -93,19 +147,23 @@ class VeilBrowser(QMainWindow):
 
         # Navigation bar
         nav_bar = QHBoxLayout()
-        web_view = self.tabs.get_current_web_view()
-        if web_view:
-            page = web_view.page()
-            if page:
-                self.back_btn = ToolButton(page.action(WebAction.Back))
-                self.forward_btn = ToolButton(page.action(WebAction.Forward))
-                self.refresh_btn = ToolButton(page.action(WebAction.Reload))
+        # Tabs swap pages (e.g. prerenders), so act on whichever is current
+        self.back_btn = ToolButton(lambda: self.trigger_page_action(WebAction.Back))
+        self.forward_btn = ToolButton(
+            lambda: self.trigger_page_action(WebAction.Forward)
+        )
+        self.refresh_btn = ToolButton(
+            lambda: self.trigger_page_action(WebAction.Reload)
+        )
 
         self.home_btn = ToolButton(
             lambda: self.navigate(self.config.homepage),
         )
+        self.adblock_btn = ToolButton(self.toggle_site_adblock)
+        self.tabs.current_url_changed.connect(self._update_adblock_icon)
         self.address_bar: QLineEdit = QLineEdit()
         self.address_bar.returnPressed.connect(lambda: self.navigate(None))
+        self.address_bar.textEdited.connect(self.speculator.update)
 
         # Icons
         style_hints = self.instance.styleHints()
@@ -122,6 +180,7 @@ class VeilBrowser(QMainWindow):
         nav_bar.addWidget(self.refresh_btn)
         nav_bar.addWidget(self.home_btn)
         nav_bar.addWidget(self.address_bar)
+        nav_bar.addWidget(self.adblock_btn)
 
         layout.addLayout(nav_bar)
         layout.addWidget(self.tabs)
@@ -133,10 +192,27 @@ class VeilBrowser(QMainWindow):
 
     def _update_icon_colors(self, color_scheme: Qt.ColorScheme | None):
         is_dark: bool = color_scheme == Qt.ColorScheme.Dark
+        self.is_dark = is_dark
         self.back_btn.update_icon("arrow_back", QIcon.ThemeIcon.GoPrevious, is_dark)
         self.forward_btn.update_icon("arrow_forward", QIcon.ThemeIcon.GoNext, is_dark)
         self.refresh_btn.update_icon("refresh", QIcon.ThemeIcon.ViewRefresh, is_dark)
         self.home_btn.update_icon("home", QIcon.ThemeIcon.GoHome, is_dark)
+        self._update_adblock_icon()
+
+    def _update_adblock_icon(self, url: QUrl | None = None):
+        web_view = self.tabs.get_current_web_view()
+        if url is None:
+            url = web_view.url() if web_view else QUrl()
+        if url.host() and self.ad_blocker.is_allowlisted(url.host()):
+            self.adblock_btn.update_icon(
+                "remove_moderator", QIcon.ThemeIcon.SecurityLow, self.is_dark
+            )
+            self.adblock_btn.setToolTip(f"Ad blocking is off for {url.host()}")
+        else:
+            self.adblock_btn.update_icon(
+                "shield", QIcon.ThemeIcon.SecurityHigh, self.is_dark
+            )
+            self.adblock_btn.setToolTip("Ad blocking is on")
 
     def toggle_devtools(self):
         if self.devtools_view is None or not self.devtools_view.isVisible():
@@ -163,13 +239,6 @@ class VeilBrowser(QMainWindow):
 
     def setup_shortcuts(self):
         """Setup keyboard shortcuts for tab management"""
-        web_view = self.tabs.get_current_web_view()
-        if not web_view:
-            return
-        page = web_view.page()
-        if not page:
-            return
-
         keybinds = Keybindings.load()
 
         # New tab
@@ -178,6 +247,9 @@ class VeilBrowser(QMainWindow):
         # Close tab
         keybinds.bind_shortcuts("close_tab", self.close_current_tab, self)
 
+        # Reopen the last closed tab
+        keybinds.bind_shortcuts("reopen_tab", self.tabs.reopen_closed_tab, self)
+
         # Next tab
         keybinds.bind_shortcuts("next_tab", self.next_tab, self)
 
@@ -185,13 +257,19 @@ class VeilBrowser(QMainWindow):
         keybinds.bind_shortcuts("prev_tab", self.previous_tab, self)
 
         # Previous page
-        keybinds.bind_shortcuts("prev_page", page.action(WebAction.Back), self)
+        keybinds.bind_shortcuts(
+            "prev_page", lambda: self.trigger_page_action(WebAction.Back), self
+        )
 
         # Next page
-        keybinds.bind_shortcuts("next_page", page.action(WebAction.Forward), self)
+        keybinds.bind_shortcuts(
+            "next_page", lambda: self.trigger_page_action(WebAction.Forward), self
+        )
 
         # Refresh
-        keybinds.bind_shortcuts("refresh", page.action(WebAction.Reload), self)
+        keybinds.bind_shortcuts(
+            "refresh", lambda: self.trigger_page_action(WebAction.Reload), self
+        )
 
         # Address bar focus
         keybinds.bind_shortcuts("address_focus", self.focus_address_bar, self)
@@ -200,11 +278,30 @@ class VeilBrowser(QMainWindow):
         keybinds.bind_shortcuts("devtools", self.toggle_devtools, self)
 
         # TODO FIX: Page source
-        keybinds.bind_shortcuts("page_source", page.action(WebAction.ViewSource), self)
+        keybinds.bind_shortcuts(
+            "page_source", lambda: self.trigger_page_action(WebAction.ViewSource), self
+        )
 
         # TODO: print page shortcut
 
-        # TODO: save as shortcut
+        # Save page as
+        keybinds.bind_shortcuts("save_as", self.save_page, self)
+
+        # Downloads panel
+        keybinds.bind_shortcuts("downloads", self.downloads.panel.toggle, self)
+
+        # Lite mode
+        keybinds.bind_shortcuts("lite_mode", self.toggle_lite_mode, self)
+
+        # Tab search
+        keybinds.bind_shortcuts("tab_search", self.tab_switcher.popup, self)
+
+        # Turn ad blocking off or on for the current site
+        keybinds.bind_shortcuts("toggle_adblock", self.toggle_site_adblock, self)
+
+        # Profiler and memory snapshots, written to data/profiles
+        keybinds.bind_shortcuts("toggle_profiler", self.profiler.toggle, self)
+        keybinds.bind_shortcuts("memory_snapshot", self.profiler.memory_snapshot, self)
 
         # Copy address bar to clipboard
         keybinds.bind_shortcuts(
@@ -248,18 +345,101 @@ class VeilBrowser(QMainWindow):
         else:
             logger.warning("Didn't find configuration file!")
 
-        # TODO: Reload config
-        # keybinds.bind_shortcuts("reload_config", self.reload_config, self)
+        # Reload config
+        keybinds.bind_shortcuts("reload_config", self.reload_config, self)
 
     def reload_config(self):
-        Config.reload()
-        Keybindings.reload()
+        self.config_watcher.reload()
         logger.info("Config and keybindings successfully reloaded!")
 
+    def apply_config_changes(self, changes: dict):
+        """Apply edited settings to the running browser, without reloading tabs"""
+        # Most settings are read when used, e.g. homepage and search engine
+        if "icon_theme" in changes:
+            self._update_icon_colors(
+                Qt.ColorScheme.Dark if self.is_dark else Qt.ColorScheme.Light
+            )
+        if "zoom_level" in changes:
+            self.zoom_cycler = StepCycler(
+                self.zoom_cycler.steps, initial_value=self.config.zoom_level
+            )
+            self.tabs.set_zoom_level(self.zoom_cycler.current())
+        if changes.keys() & {"stdout_log", "log_level"}:
+            update_logging(self.config)
+        if "lite_mode" in changes:
+            # Applies from each tab's next navigation on
+            self.tabs.site_settings.lite_mode = self.config.lite_mode
+            self.tabs.apply_site_settings()
+        if changes.keys() & {
+            "memory_budget_mb",
+            "memory_min_free_percent",
+            "memory_check_interval",
+        }:
+            self.memory_governor.configure()
+        if "download_bandwidth_kbps" in changes:
+            self.downloads.limiter.set_rate(self.config.download_bandwidth_kbps * 1024)
+        if "slow_handler_threshold_ms" in changes:
+            self._configure_watchdog()
+
+        restart = changes.keys() & RESTART_SETTINGS
+        if restart:
+            logger.info(
+                f"Changes to {', '.join(sorted(restart))} apply after a restart"
+            )
+
+    def _configure_watchdog(self):
+        if self.watchdog:
+            self.watchdog.stop()
+            self.watchdog.deleteLater()
+            self.watchdog = None
+        if self.config.slow_handler_threshold_ms > 0:
+            self.watchdog = SlowHandlerWatchdog(
+                self.config.slow_handler_threshold_ms, self
+            )
+            self.watchdog.start()
+            self.instance.aboutToQuit.connect(self.watchdog.stop)
+
+    def toggle_lite_mode(self):
+        """Turn lite mode on or off for every tab, reloading the current one"""
+        self.tabs.site_settings.toggle_lite_mode()
+        self.tabs.apply_site_settings()
+        web_view = self.tabs.get_current_web_view()
+        if web_view:
+            web_view.reload()
+
+    def toggle_site_adblock(self):
+        """Allowlist the current site or block on it again, then reload"""
+        web_view = self.tabs.get_current_web_view()
+        if not web_view or not web_view.url().host():
+            return
+        self.ad_blocker.toggle_site(web_view.url().host())
+        self._update_adblock_icon()
+        web_view.reload()
+
+    def trigger_page_action(self, action: WebAction):
+        """Run a page action (back, reload, ...) on the current tab's page"""
+        web_view = self.tabs.get_current_web_view()
+        if web_view:
+            web_view.triggerPageAction(action)
+
+    def save_page(self):
+        """Save the current page, handled by the download manager"""
+        web_view = self.tabs.get_current_web_view()
+        if web_view:
+            web_view.triggerPageAction(WebAction.SavePage)
+
     def create_new_tab(self):
         """Create a new tab"""
         self.tabs.create_new_tab()
 
+    def open_in_new_tab(self, url: str | None):
+        """Open a URL handed over by another launch and bring the window up"""
+        self.tabs.create_new_tab(url)
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
     def close_current_tab(self):
         """Close the current tab"""
         current_index = self.tabs.currentIndex()
@@ -292,22 +472,20 @@ class VeilBrowser(QMainWindow):
 
     def navigate(self, input: str | None):
         text = input or self.address_bar.text()
-
-        # Try parsing as URL
-        url = QUrl(text)
-
-        if not url.scheme():
-            if "." in text and " " not in text:
-                url = QUrl("https://" + text)
-            else:
-                # Search query
-                search_url = str(self.config.search_engine).replace("%s", text)
-                url = QUrl(search_url)
+        url = text_to_url(text, str(self.config.search_engine))
 
         # Navigate current tab
         web_view = self.tabs.get_current_web_view()
-        if web_view:
-            web_view.setUrl(url)
+        if not web_view:
+            return
+
+        # Swap in the speculatively loaded page if it matches
+        speculated = self.speculator.take(url)
+        if speculated:
+            page, loaded = speculated
+            self.tabs.adopt_page(web_view, page, loaded)
+        else:
+            self.tabs.load_url(web_view, url)
 
     def update_url(self, url: QUrl):
         """Update address bar with current tab's URL"""
@@ -1,16 +1,153 @@
 import sys
-import platform
-from typing import cast
-import psutil
-from PyQt6.QtWebEngineCore import qWebEngineChromiumVersion
-from PyQt6.QtWidgets import QApplication
-from PyQt6.QtGui import QFont, QIcon
+from browser.startup import tracer
 
-from browser.window import VeilBrowser
-from browser.utils import Config, setup_logging
+with tracer.phase("import stdlib"):
+    import argparse
+    import os
+    import platform
+    from typing import cast
+
+with tracer.phase("import psutil"):
+    import psutil
+
+with tracer.phase("import PyQt6"):
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtGui import QFont, QIcon
+
+with tracer.phase("import browser.utils"):
+    from browser.utils import Config, setup_logging
+
+with tracer.phase("config"):
+    Config.load()
 
 # Set up logging
-logger = setup_logging()
+with tracer.phase("logging"):
+    logger = setup_logging()
+
+
+# Qt options whose value is the next argument, e.g. -platform offscreen
+QT_VALUE_OPTIONS = {
+    "-platform",
+    "-platformpluginpath",
+    "-platformtheme",
+    "-plugin",
+    "-qwindowgeometry",
+    "-qwindowicon",
+    "-qwindowtitle",
+    "-session",
+    "-style",
+    "-stylesheet",
+    "-display",
+    "-geometry",
+    "-name",
+    "-visual",
+}
+
+
+def split_qt_value_options(argv: list[str]) -> tuple[list[str], list[str]]:
+    """Take Qt's options that have a value out of the arguments, with it"""
+    ours: list[str] = []
+    qt_args: list[str] = []
+    arguments = iter(argv)
+    for argument in arguments:
+        # Qt takes its options with one dash or two
+        name = argument[1:] if argument.startswith("--") else argument
+        if name in QT_VALUE_OPTIONS:
+            qt_args.append(argument)
+            value = next(arguments, None)
+            if value is not None:
+                qt_args.append(value)
+        else:
+            ours.append(argument)
+    return ours, qt_args
+
+
+def parse_args() -> tuple[argparse.Namespace, list[str]]:
+    """Parse our own arguments, leaving the rest for Qt"""
+    parser = argparse.ArgumentParser(prog="veil-browser")
+    parser.add_argument("url", nargs="?", help="URL or file to open")
+    parser.add_argument(
+        "--startup-benchmark",
+        action="store_true",
+        help="start offscreen, load a local page, print startup timings and exit",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="URLS_FILE",
+        help="load every URL in the file (one per line) headlessly and report timings",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=4,
+        help="number of pages loaded at the same time in --batch mode",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="seconds before a page counts as failed in --batch mode",
+    )
+    # Any other option is taken to have no value, or to join it with "="
+    ours, qt_args = split_qt_value_options(sys.argv[1:])
+    args, unknown = parser.parse_known_args(ours)
+    return args, qt_args + unknown
+
+
+# A later launch only hands its URL over, before paying for Qt WebEngine
+with tracer.phase("single instance"):
+    from browser.single_instance import (
+        InstanceServer,
+        forward_to_running_instance,
+        url_from_argument,
+    )
+
+    args, qt_args = parse_args()
+    initial_url = url_from_argument(args.url)
+    if Config.load().single_instance and not (args.batch or args.startup_benchmark):
+        if forward_to_running_instance(initial_url):
+            sys.exit(0)
+
+with tracer.phase("import adblock"):
+    import adblock  # noqa: F401 (timed here, used by browser.adblock)
+
+with tracer.phase("import pyperclip"):
+    import pyperclip  # noqa: F401 (timed here, used by browser.window)
+
+with tracer.phase("import browser.window"):
+    from PyQt6.QtWebEngineCore import qWebEngineChromiumVersion
+    from browser.redirects import register_resource_scheme
+    from browser.window import VeilBrowser
+
+# Page used by --startup-benchmark, so the network stays out of the timings
+BENCHMARK_PAGE = "data:text/html,<title>Veil Browser</title><h1>Veil Browser</h1>"
+# --batch loads most pages in hidden tabs, which Chromium would otherwise slow
+BATCH_CHROMIUM_FLAGS = (
+    "--disable-background-timer-throttling"
+    " --disable-renderer-backgrounding"
+    " --disable-backgrounding-occluded-windows"
+)
+
+
+def run_batch(args: argparse.Namespace, app: QApplication) -> int:
+    """Load a URL list headlessly and print per-page and aggregate results"""
+    # Imported here so interactive startup does not pay for it
+    from browser.batch import BatchRunner, read_url_list
+
+    urls = read_url_list(args.batch)
+    if not urls:
+        logger.error(f"[ERR] No URLs found in {args.batch}")
+        return 1
+
+    runner = BatchRunner(urls, parallel=args.parallel, timeout=args.timeout)
+    runner.finished.connect(app.quit)
+    runner.start()
+    app.exec()
+
+    print(runner.format())
+    batch_file = runner.write()
+    logger.info(f"Batch results written to {batch_file}")
+    return 0 if all(result.ok for result in runner.results) else 1
 
 
 def main():
@@ -23,21 +160,64 @@ def main():
         logger.info("Starting...")
         logger.info("=" * 50)
 
-        app = QApplication(sys.argv)
-        app.setApplicationName("Veil Browser")
-        app.setWindowIcon(QIcon("browser/logo.svg"))
-        app.setApplicationVersion(config.local_version)
+        if args.startup_benchmark:
+            os.environ["QT_QPA_PLATFORM"] = "offscreen"
+        elif args.batch:
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+            flags = os.environ.get("QTWEBENGINE_CHROMIUM_FLAGS", "")
+            os.environ["QTWEBENGINE_CHROMIUM_FLAGS"] = (
+                f"{flags} {BATCH_CHROMIUM_FLAGS}".strip()
+            )
+
+        with tracer.phase("QApplication"):
+            # Custom schemes have to be known before Qt WebEngine starts
+            register_resource_scheme()
+            app = QApplication([sys.argv[0], *qt_args])
+            app.setApplicationName("Veil Browser")
+            app.setWindowIcon(QIcon("browser/logo.svg"))
+            app.setApplicationVersion(config.local_version)
+
+        if args.batch:
+            tracer.finish()
+            sys.exit(run_batch(args, app))
 
         # Font configuration
-        try:
-            font = QFont("Segoe UI", 9)
-            app.setFont(font)
-        except Exception as e:
-            logger.warning(f"Font setup failed: {e}")
+        with tracer.phase("fonts"):
+            try:
+                font = QFont("Segoe UI", 9)
+                app.setFont(font)
+            except Exception as e:
+                logger.warning(f"Font setup failed: {e}")
 
         # Create and show browser
-        browser = VeilBrowser()
-        browser.show()
+        with tracer.phase("VeilBrowser"):
+            # The benchmark page stays out of the user's history and favicons
+            browser = VeilBrowser(
+                BENCHMARK_PAGE if args.startup_benchmark else initial_url,
+                record_history=not args.startup_benchmark,
+            )
+        with tracer.phase("show"):
+            browser.show()
+
+        # Later launches open their URLs here instead of starting over
+        if config.single_instance and not args.startup_benchmark:
+            instance_server = InstanceServer(browser)
+            instance_server.open_requested.connect(browser.open_in_new_tab)
+            instance_server.listen()
+
+        def on_first_load(ok: bool):
+            tracer.mark(f"first loadFinished ({'ok' if ok else 'failed'})")
+            if not tracer.finish():
+                return
+            startup_file = tracer.write()
+            logger.info(f"Startup timeline written to {startup_file}")
+            if args.startup_benchmark:
+                print(tracer.format())
+                app.quit()
+
+        web_view = browser.tabs.get_current_web_view()
+        if web_view:
+            web_view.loadFinished.connect(on_first_load)
 
         # System info logging
         logger.info(f"System: {platform.platform()}")
@@ -0,0 +1,186 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from browser.downloader import (
+    ConnectionPool,
+    DownloadState,
+    RateLimiter,
+    SegmentedDownload,
+)
+
+SIZE = 1024 * 1024
+
+
+class RangeServer(ThreadingHTTPServer):
+    """Serves one file, with or without Range support"""
+
+    daemon_threads = True
+
+    def __init__(self, body: bytes, ranges: bool = True) -> None:
+        super().__init__(("127.0.0.1", 0), RangeHandler)
+        self.ranges = ranges
+        # Seconds between 16 KB pieces, so a download can be paused midway
+        self.delay = 0.0
+        self.set_body(body)
+
+    def set_body(self, body: bytes) -> None:
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients close the connection on a probe answered with 200
+        pass
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/file.bin"
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server = self.server
+        assert isinstance(server, RangeServer)
+        body = server.body
+        byte_range = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if (
+            server.ranges
+            and byte_range
+            and (not if_range or if_range == server.etag)
+        ):
+            first, _, last = byte_range.removeprefix("bytes=").partition("-")
+            start, end = int(first), min(int(last or len(body) - 1), len(body) - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+            body = body[start : end + 1]
+        else:
+            self.send_response(200)
+        if server.ranges:
+            self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), 16 * 1024):
+            self.wfile.write(body[start : start + 16 * 1024])
+            time.sleep(server.delay)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def serve():
+    servers: list[RangeServer] = []
+
+    def start(body: bytes, ranges: bool = True) -> RangeServer:
+        server = RangeServer(body, ranges)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_download(url: str, tmp_path: Path, **kwargs) -> SegmentedDownload:
+    return SegmentedDownload(
+        DownloadState(url=url, path=str(tmp_path / "file.bin")),
+        tmp_path / "state.json",
+        ConnectionPool(timeout=5),
+        RateLimiter(),
+        min_segment_size=256 * 1024,
+        **kwargs,
+    )
+
+
+def pause_midway(server: RangeServer, download: SegmentedDownload) -> None:
+    server.delay = 0.01
+    download.start()
+    while not download.received:
+        assert download.is_active
+        time.sleep(0.01)
+    download.pause()
+    server.delay = 0
+    download.wait(5)
+    assert download.state.status == "paused"
+    assert 0 < download.received < SIZE
+
+
+def test_segmented_download(serve, tmp_path: Path) -> None:
+    body = bytes(range(256)) * (SIZE // 256)
+    download = make_download(serve(body).url, tmp_path)
+    download.start()
+    download.wait(10)
+
+    assert download.state.status == "finished"
+    assert len(download.state.segments) == 4
+    assert (tmp_path / "file.bin").read_bytes() == body
+    assert not (tmp_path / "state.json").exists()
+
+
+def test_resume_after_restart(serve, tmp_path: Path) -> None:
+    body = bytes(range(256)) * (SIZE // 256)
+    server = serve(body)
+    download = make_download(server.url, tmp_path)
+    pause_midway(server, download)
+
+    # As if the browser had been restarted
+    resumed = SegmentedDownload.load(
+        tmp_path / "state.json", ConnectionPool(timeout=5), RateLimiter()
+    )
+    assert resumed.state.validator == server.etag
+    assert resumed.received == download.received
+    resumed.start()
+    resumed.wait(10)
+
+    assert resumed.state.status == "finished"
+    assert (tmp_path / "file.bin").read_bytes() == body
+
+
+def test_changed_file_restarts(serve, tmp_path: Path) -> None:
+    server = serve(b"a" * SIZE)
+    download = make_download(server.url, tmp_path)
+    pause_midway(server, download)
+
+    # Same size, only the validator tells the versions apart
+    server.set_body(b"b" * SIZE)
+    download.start()
+    download.wait(10)
+
+    assert download.state.status == "finished"
+    assert download.state.validator == server.etag
+    assert (tmp_path / "file.bin").read_bytes() == b"b" * SIZE
+
+
+def test_no_ranges_handed_back(serve, tmp_path: Path) -> None:
+    handed_back: list[SegmentedDownload] = []
+    download = make_download(
+        serve(b"c" * SIZE, ranges=False).url,
+        tmp_path,
+        on_ranges_unsupported=handed_back.append,
+    )
+    download.start()
+    download.wait(10)
+
+    assert handed_back == [download]
+    assert not (tmp_path / "file.bin").exists()
+    assert not (tmp_path / "file.bin.part").exists()
+    assert not (tmp_path / "state.json").exists()
+
+
+def test_no_ranges_single_connection(serve, tmp_path: Path) -> None:
+    download = make_download(serve(b"d" * SIZE, ranges=False).url, tmp_path)
+    download.start()
+    download.wait(10)
+
+    assert download.state.status == "finished"
+    assert len(download.state.segments) == 1
+    assert (tmp_path / "file.bin").read_bytes() == b"d" * SIZE